@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import src.acquire.egauge as egauge
+import time
+import sys
+import gc
+
+# times egauge response parsing (& row building) over a synthetic
+# response of `n` samples x `regs` registers, with gc disabled.
+# usage: python -m bench.egauge_parse [n] [regs]
+
+def original(text):
+    rows = [line.split(',') for line in text.splitlines()]
+    headers = [h.replace('"','') for h in rows.pop(0)]
+    columns = list(zip(*rows))
+    return {h: list(map(float,columns[i])) for i,h in enumerate(headers)}
+
+args = list(map(int,sys.argv[1:]))
+n = args[0] if args else 10080
+regs = args[1] if len(args) > 1 else 100
+header = '"Date & Time",' + ','.join('"R{} [kW]"'.format(i) for i in range(regs))
+values = lambda i: ','.join('{:.3f}'.format((i * 7 + j) % 1000 / 7) for j in range(regs))
+lines = [header] + ['{},{}'.format(1700000000 - 60 * i,values(i)) for i in range(n)]
+text = '\r\n'.join(lines)
+parsers = {
+    'original': lambda: original(text),
+    'parse_csv': lambda: egauge.parse_csv(iter(lines)),
+    }
+if egauge.np is not None: parsers['parse_columnar'] = lambda: egauge.parse_columnar(iter(lines))
+gc.disable()
+results = []
+for name,parse in parsers.items():
+    start = time.perf_counter()
+    parsed = parse()
+    mid = time.perf_counter()
+    results.append(egauge.fmt_query('g',parsed))
+    end = time.perf_counter()
+    print('{:<15} parse {:.2f}s  + rows {:.2f}s'.format(name,mid - start,end - start))
+assert all(r == results[0] for r in results)
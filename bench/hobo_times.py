@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+import src.acquire.parsers.hobo_u12_csv as hobo
+import time
+import sys
+
+# times hobo-u12 timestamp parsing over `n` one-minute samples logged
+# at gmt-10:00 against the original per-string `strptime`.
+# usage: python -m bench.hobo_times [n]
+
+def original(times,offset):
+    fmt = '%m/%d/%y %I:%M:%S %p %z'
+    return [time.mktime(time.strptime(t + ' ' + offset,fmt)) for t in times]
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+fmt = lambda i: time.strftime('%m/%d/%y %I:%M:%S %p',time.gmtime(1483264800 + i * 60))
+times = [fmt(i) for i in range(n)]
+results = []
+for name,fn in [('original',original),('parse_times',hobo.parse_times)]:
+    start = time.perf_counter()
+    results.append(fn(times,'-1000'))
+    print('{:<12} {:.2f}s'.format(name,time.perf_counter() - start))
+assert results[0] == results[1]
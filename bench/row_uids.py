@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import src.core.data_utils as du
+from src.core.data_utils import Row
+import tracemalloc
+import time
+import sys
+
+# times uid generation over `n` rows from 40 nodes x 25 sensors against
+# the original per-row join, with the memory held by the uids.
+# usage: python -m bench.row_uids [n]
+
+def original(rows):
+    return ['-'.join(row[i] for i in (0,1,2)).lower() for row in rows]
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+rows = [Row('Node {}'.format(i % 40),'sensor-{}'.format(i % 25),'kWh',float(i),0.0)
+    for i in range(n)]
+results = []
+for name,fn in [('original',original),('get_uids',lambda r: list(du.get_uids(r)))]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    results.append(fn(rows))
+    elapsed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    strings = len(set(map(id,results[-1])))
+    print('{:<9} {:.2f}s {:6.1f}MB {:>8} strings'.format(name,elapsed,held / 1e6,strings))
+assert results[0] == results[1]
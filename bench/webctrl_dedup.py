@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+from src.core.data_utils import Row
+import src.acquire.webctrl as webctrl
+import time
+import sys
+
+# times webctrl dedup & buffer exclusion against the original list-based
+# code, for `n` rows & an n/2 entry buffer.
+# usage: python -m bench.webctrl_dedup [n ...]
+
+mkrow = lambda t,v: Row('node','name','unit',float(t//1000),float(v))
+
+def original(data,buff):
+    raw_rows = [mkrow(r['t'],r['a']) for r in data if not '?' in r.values()]
+    rows,times = [],[]
+    for row in raw_rows:
+        if not row.timestamp in times:
+            times.append(row.timestamp)
+            rows.append(row)
+    for t in buff:
+        rows = list(filter(lambda r,t=t: r.timestamp != t,rows))
+    return rows
+
+def current(data,buff):
+    rows,dups = webctrl.parse_rows(mkrow,data)
+    return webctrl.exclude_times(rows,buff)
+
+for n in [int(n) for n in sys.argv[1:]] or [1000,2500,5000,10000]:
+    # every tenth sample repeats the previous timestamp.
+    data = [{'t': (i - (i % 10 == 9)) * 60000, 'a': i} for i in range(n)]
+    buff = [float(i * 60) for i in range(n // 2)]
+    results = []
+    for fn in (original,current):
+        start = time.perf_counter()
+        results.append(fn(data,buff))
+        print('{:>6} rows {:<9} {:.4f}s'.format(n,fn.__name__,time.perf_counter() - start))
+    assert results[0] == results[1]
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 import src.core.data_utils as du
 import src.core.error_utils as eu
+from itertools import repeat,compress,islice
 import requests
 import time
 
+# numpy is optional; if available, responses may be parsed
+# via the opt-in columnar fast-path (see `parse_columnar`).
+try: import numpy as np
+except ImportError: np = None
+
 
 egauge_error = eu.error_template("`egauge` data-acquisition step")
 
@@ -11,25 +17,53 @@ egauge_error = eu.error_template("`egauge` data-acquisition step")
 # primary entry point for scrape of egauges.
 # Returns any acquired data & updated nonce.
 def acquire(project,config,state):
-    starts,stops = setup_times(project,config,state)
-    gauges = config['gauges']
-    nonce = {k:v for k,v in starts.items()}
     data = []
-    fltr = lambda r : r.timestamp
-    for gid in gauges:
-        print('querying egauge: {}...'.format(gid))
-        raw = query(gauges[gid],starts[gid],stops[gid])
-        if not raw: continue
-        rows = fmt_query(gid,raw)
-        if not rows: continue
-        fltr = lambda r: r.timestamp
-        nonce[gid] = max(rows,key=fltr).timestamp
+    for rows in iter_acquire(project,config,state):
         data += rows
+    return state,data
+
+
+# generator form of `acquire`, which yields the (filtered) rows
+# of each query window in turn, updating `state` in place once
+# all windows have been consumed.
+def iter_acquire(project,config,state):
+    starts,stops = setup_times(project,config,state)
+    settings = config.get('settings',{})
+    window = settings.get('window-time',604800)
+    columnar = settings.get('columnar',False)
+    if columnar and np is None:
+        raise Exception(egauge_error('configuring query')('`columnar` requires numpy'))
+    nonce = {k:v for k,v in starts.items()}
+    windows = iter_windows(config['gauges'],starts,stops,window,nonce,columnar)
+    for rows in windows:
+        if 'filter' in config:
+            rows = run_filters(config['filter'],rows)
+        if rows: yield rows
     print('egauge queries complete...\n')
-    if 'filter' in config:
-        data = run_filters(config['filter'],data)
     state['nonce'] = nonce
-    return state,data
+
+
+# query all gauges window by window, yielding the rows of each
+# window in turn.  the time range of each gauge is split into
+# windows of at most `window` seconds.  `nonce` is updated in
+# place, and only once a window's rows have been consumed.  if a
+# query fails, the remaining windows of that gauge are skipped.
+def iter_windows(gauges,starts,stops,window,nonce,columnar=False):
+    fltr = lambda r: r.timestamp
+    for gid in gauges:
+        print('querying egauge: {}...'.format(gid))
+        start = starts[gid]
+        while start < stops[gid]:
+            stop = min((start + window,stops[gid]))
+            raw = query(gauges[gid],start,stop,columnar)
+            if raw is None: break
+            # windows are inclusive of both ends, so the
+            # next window begins one second past this one.
+            start = stop + 1
+            rows = fmt_query(gid,raw) if raw else []
+            if not rows: continue
+            yield rows
+            nonce[gid] = max(rows,key=fltr).timestamp
 
 
 # a limited data filtering functionality, because method
@@ -37,17 +71,20 @@ def acquire(project,config,state):
 # to pre-imtively remove unwanted values.
 def run_filters(filters,data):
     mkerr = egauge_error("filtering acquired data-points")
-    rows = [r for r in data]
+    # compile all filters into a single predicate, which is
+    # evaluated once per distinct combination of matched fields.
+    checks,indexes = [],[]
     for spec in filters:
-        mode = spec.pop("mode")
-        ismatch,nomatch = du.match_rows(spec,rows)
-        if mode == "positive":
-            rows = ismatch
-        elif mode == "negative":
-            rows = nomatch
-        else:
+        mode = spec["mode"]
+        if not mode in ("positive","negative"):
             error = mkerr("unrecognized filter mode: " + str(mode))
             raise Exception(error)
+        match = {k: v for k,v in spec.items() if k != "mode"}
+        fields,first_miss = du.compile_matcher(match)
+        checks.append((first_miss,mode == "positive"))
+        indexes += fields
+    keep = lambda r: all((miss(r) is None) == pos for miss,pos in checks)
+    rows = list(compress(data,du.classify_rows(keep,indexes,data)))
     return rows
 
 
@@ -68,31 +105,68 @@ def setup_times(project,config,state):
 
 
 # Query a specified egauge.
-# Returns a dictionary of all columns w/ headers as keys.
-def query(gauge,start,stop):
+# Returns a dictionary of all columns w/ headers as keys,
+# or `None` if the query failed.  If `columnar` is set,
+# columns are returned as numpy arrays.
+def query(gauge,start,stop,columnar=False):
     uri = 'http://egauge{}.egaug.es/cgi-bin/egauge-show?c&C&m'
     params = {'t': int(start), 'f': int(stop)}
-    r = requests.get(uri.format(gauge),params=params)
+    r = requests.get(uri.format(gauge),params=params,stream=True)
     if not r.status_code == 200:
         print('\n------------- warning -------------')
         print('  query failed with status code: ',r.status_code)
         print('  check gauge if this problem persists')
         print('-----------------------------------\n')
-        return {}
-    # break up the recieved csv into two-dimensional list structure.
-    rows = [[y for y in x.split(',')] for x in r.text.splitlines()]
-    if not rows: return {}
-    headers = [h.replace('"','') for h in rows.pop(0)]
-    columns = list(zip(*rows))
-    if not columns: return {}
-    # reshape columns into form { header : [ values ] }
-    return {h: list(map(float,columns[i])) for i,h in enumerate(headers)}
+        return None
+    r.encoding = r.encoding or 'utf-8'
+    # the response is read line by line, rather than
+    # loading the entire csv into memory at once.
+    lines = r.iter_lines(decode_unicode=True)
+    if columnar: return parse_columnar(lines)
+    return parse_csv(lines)
+
+# Parse lines of egauge csv into columns, of the
+# form { header : [ values ] }, one line at a time.
+def parse_csv(lines):
+    lines = (l for l in lines if l)
+    header = next(lines,None)
+    if not header: return {}
+    headers = [h.replace('"','') for h in header.split(',')]
+    columns = [[] for h in headers]
+    appends = [c.append for c in columns]
+    for line in lines:
+        for append,value in zip(appends,line.split(',')):
+            append(float(value))
+    if not columns[0]: return {}
+    return dict(zip(headers,columns))
+
+# Parse lines of egauge csv into a timestamp array & one value
+# array per register.  Lines are parsed by numpy in blocks of
+# at most `block` lines, so only one block is held as text.
+def parse_columnar(lines,block=4096):
+    lines = (l for l in lines if l)
+    header = next(lines,None)
+    if not header: return {}
+    headers = [h.replace('"','') for h in header.split(',')]
+    blocks = []
+    while True:
+        chunk = list(islice(lines,block))
+        if not chunk: break
+        values = np.loadtxt(chunk,delimiter=',',ndmin=2)
+        if values.shape[1] != len(headers):
+            raise Exception(egauge_error('parsing query')('malformed csv'))
+        blocks.append(values)
+    if not blocks: return {}
+    values = np.concatenate(blocks)
+    return {h: values[:,i] for i,h in enumerate(headers)}
 
 # Convert into row format.
 # Returns list of named tuples.
 def fmt_query(gauge_id,data):
     # separate times from readings.
-    dtimes = data['Date & Time']
+    # columns may be lists or numpy arrays.
+    tolist = lambda c: c.tolist() if hasattr(c,'tolist') else c
+    dtimes = tolist(data['Date & Time'])
     values = {k: data[k] for k in data if k != 'Date & Time'}
     formatted = []
     # break out readings into form standard form:
@@ -100,7 +174,11 @@ def fmt_query(gauge_id,data):
     for sn in values:
         name,unit = parse_sntxt(sn)
         mkrow = du.row_generator(gauge_id,name,unit)
-        formatted += [mkrow(t,v) for t,v in zip(dtimes,values[sn])]
+        # all values are already floats, so rows are built
+        # directly from the formatted identity fields.
+        ident = (repeat(f) for f in mkrow(0,0)[:3])
+        cells = zip(*ident,dtimes,tolist(values[sn]))
+        formatted += map(du.Row._make,cells)
     return formatted
 
 # Split the egauge supplied sensor/column name
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 from src.core.data_utils import Row,fmt_string
+import src.core.data_utils as du
+import calendar
 import time
 import csv
 
@@ -8,24 +10,40 @@ REQUIRE = []
 
 # primary entry point of this parser.
 def parse(project,config,state,filepath):
-    rawdata = read_csv(filepath)
-    rows = reformat_data(config,rawdata)
+    state,rows = du.collect_chunks(stream(project,config,state,filepath))
     return state,rows
 
-# reformat raw data into `Row` objects.
-def reformat_data(config,rawdata):
-    title = rawdata.pop(0) # extract title row.
+# streaming entry point; yields rows in chunks of
+# `chunk-size` lines & returns the new state.
+def stream(project,config,state,filepath):
+    size = config.get('chunk-size',10000)
+    with open(filepath) as fp:
+        reader = csv.reader(fp)
+        node,timezone,mapping = read_header(reader)
+        # share one time parser (& its cache) across all chunks.
+        totime = time_parser(timezone,config.get('honor-offset',False))
+        for chunk in du.chunk_iter(reader,size):
+            yield reformat_data(node,totime,mapping,chunk)
+    return state
+
+# consume the title & header rows of the raw data.
+def read_header(reader):
+    title = next(reader) # extract title row.
     print('title-string: ',title) # DEBUG
     hoboid = title[0].split(' ').pop().replace('"','') # extract id from title.
     print('hobo-id: ',hoboid) # DEBUG
     node = 'hobo-{}'.format(fmt_string(hoboid))
-    rows = [r[1:] for r in rawdata] # remove col 1 (row numbers).
-    headers = rows.pop(0) # extract headers.
+    headers = next(reader)[1:] # extract headers (minus row numbers).
     # get timezone and a mapping of form [(name,unit),...]
     timezone,mapping = parse_headers(headers)
+    return node,timezone,mapping
+
+# reformat raw data into `Row` objects.
+def reformat_data(node,totime,mapping,rawdata):
+    rows = [r[1:] for r in rawdata] # remove col 1 (row numbers).
     timestrings = [r.pop(0) for r in rows] # extract time column.
     # convert list of time strings to a list of unix timestamps.
-    timestamps = parse_times(timestrings,offset=timezone)
+    timestamps = [totime(t) for t in timestrings]
     formatted = []
     for row,ts in zip(rows,timestamps):
         for i,value in enumerate(row):
@@ -58,21 +76,74 @@ def parse_headers(headers):
     return timezone,mapping
 
 # parse the hobo-u12 time encoding.
-def parse_times(times,offset=None):
+def parse_times(times,offset=None,honor=False):
+    totime = time_parser(offset,honor)
+    return [totime(t) for t in times]
+
+# get a function which converts hobo-u12 time strings to unix
+# timestamps.  times are read in the local zone of the host (the
+# logger's utc offset is checked, but otherwise ignored), unless
+# `honor` is set, in which case the offset is applied instead.
+def time_parser(offset=None,honor=False):
     fmt = '%m/%d/%y %I:%M:%S %p'
+    if offset and honor: return offset_parser(offset)
     if offset:
-        times = [t + ' ' + offset for t in times]
-        fmt = fmt + ' %z'
-    timestamps = []
-    for t in times:
-        extract = time.strptime(t,fmt)
-        timestamps.append(time.mktime(extract))
-    return timestamps
-
-
-
+        # malformed offsets are rejected, as by `strptime` below.
+        time.strptime(offset,'%z')
+        slow = lambda t: time.mktime(time.strptime(t + ' ' + offset,fmt + ' %z'))
+    else: slow = lambda t: time.mktime(time.strptime(t,fmt))
+    # logger times are regular, so the start of each local hour is
+    # memoized & the minutes & seconds are added directly.  hours within
+    # two hours of a change in utc offset (e.g.; dst) are left to `mktime`
+    # (which is not called otherwise, as it may guess differently in
+    # ambiguous hours depending upon its earlier calls), so that the
+    # results always match `slow` exactly.
+    def hour_start(date,hour):
+        y,m,d = time.strptime(date,'%m/%d/%y')[:3]
+        naive = calendar.timegm((y,m,d,hour,0,0))
+        start = naive - time.localtime(naive).tm_gmtoff
+        local = time.localtime(start)
+        if local[:6] != (y,m,d,hour,0,0): return None
+        offsets = {time.localtime(start + dt).tm_gmtoff for dt in (-7200,7200)}
+        return float(start) if offsets == {local.tm_gmtoff} else None
+    return fast_parser(slow,hour_start,{})
 
+# get a function which converts hobo-u12 time strings to unix
+# timestamps, applying the logger's utc `offset`.
+def offset_parser(offset):
+    fmt = '%m/%d/%y %I:%M:%S %p %z'
+    gmtoff = time.strptime(offset,'%z').tm_gmtoff
+    slow = lambda t: float(calendar.timegm(time.strptime(t + ' ' + offset,fmt)) - gmtoff)
+    # without dst, each hour starts a fixed time after utc midnight.
+    days = {} # memo of form {date-string: utc-seconds}
+    def hour_start(date,hour):
+        if not date in days:
+            days[date] = calendar.timegm(time.strptime(date,'%m/%d/%y')) - gmtoff
+        return float(days[date] + hour * 3600)
+    return fast_parser(slow,hour_start,{})
 
+# get a function which converts hobo-u12 time strings to unix
+# timestamps, via the memoized `hour_start` of each date & hour.
+# anything unexpected (or any hour without a start) is handed
+# off to `slow`.
+def fast_parser(slow,hour_start,hours):
+    meridian = {'am': 0, 'pm': 12}
+    def totime(t):
+        try:
+            date,clock,half = t.split(' ')
+            hms = clock.split(':')
+            if len(hms) != 3 or not all(x.isdigit() and len(x) <= 2 for x in hms):
+                return slow(t)
+            h,m,s = map(int,hms)
+            if not (0 < h < 13 and m < 60 and s < 62): return slow(t)
+            hour = h % 12 + meridian[half.lower()]
+            key = date,hour
+            if not key in hours: hours[key] = hour_start(date,hour)
+            start = hours[key]
+            if start is None: return slow(t)
+            return start + m * 60 + s
+        except (ValueError,KeyError): return slow(t)
+    return totime
 
 
 def read_csv(filename):
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from src.core.utils import Row
+from src.core.data_utils import Row,chunk_iter,collect_chunks
 import csv
 
 # This is an example implementation of a
@@ -17,12 +17,21 @@ import csv
 REQUIRE = []
 
 # primary entry point.
-def parse(config,state,filepath):
-    # get the raw rows from the csv file.
-    raw  = readcsv(filepath)
-    # parse raw rows into expected format.
-    rows = rowparse(raw)
-    return rows
+def parse(project,config,state,filepath):
+    state,rows = collect_chunks(stream(project,config,state,filepath))
+    return state,rows
+
+
+# streaming entry point; yields rows in chunks of
+# `chunk-size` lines & returns the unmodified state.
+def stream(project,config,state,filepath):
+    size = config.get('chunk-size',10000)
+    with open(filepath) as fp:
+        reader = csv.reader(fp)
+        check_headers(next(reader))
+        for chunk in chunk_iter(reader,size):
+            yield [ Row(*r) for r in chunk ]
+    return state
 
 
 # read a csv file.
@@ -32,10 +41,14 @@ def readcsv(filepath):
         rows = [ r for r in reader ]
     return rows
 
-# parse the raw rows from csv.
-def rowparse(raw):
-    headers = [ h.lower() for h in raw.pop(0) ]
+# check that the csv headers match the `Row` fields.
+def check_headers(raw):
+    headers = [ h.lower() for h in raw ]
     if not headers == list(Row._fields):
         raise Exception('csv headers not in expected form.')
+
+# parse the raw rows from csv.
+def rowparse(raw):
+    check_headers(raw.pop(0))
     rows = [ Row(*r) for r in raw ]
     return rows
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 from src.core.data_utils import Row
+import src.core.data_utils as du
 from src.core.error_utils import error_template,mklog
 import src.core.file_utils as fu
+import src.core.ledger_utils as lu
 import src.core.pgrm_utils as pu
+from concurrent.futures import ProcessPoolExecutor
 import time
 import os.path as path
 import os
@@ -11,6 +14,17 @@ static_error = error_template('`static` data-acquisition step')
 
 # primary entrr point: project -> config -> state -> (state,data)
 def acquire(project,config,state):
+    data = [] # collector for successufully generated rows.
+    for rows in iter_acquire(project,config,state):
+        data += rows
+    return state,data
+
+
+# generator form of `acquire`, which yields rows in chunks as files are
+# parsed, updating `state` in place.  the rows of each file are held
+# back until the file is fully parsed, s.t. a file which fails partway
+# through (and is moved to `on-err`) contributes no rows.
+def iter_acquire(project,config,state):
     print('running `static` data-acquisition method...\n')
     # get contents of the `settings` field; defaults to empty dict.
     settings = config.get('settings',{})
@@ -30,7 +44,10 @@ def acquire(project,config,state):
     # `save_raw` function to ensure that files from different sources
     # are all sorted by the same timestamp.
     time_now = int(time.time())
-    data = [] # collector for successufully generated rows.
+    # number of worker processes to parse files with (opt-in).
+    workers = settings.get('workers',0)
+    # ledger of already parsed files (opt-in).
+    ledger = get_ledger(settings,state)
     # iteratively run all parsers.
     for spec in parsers:
         name = spec['parser'] # name of perser to use.
@@ -42,45 +59,160 @@ def acquire(project,config,state):
         source = dir_fmt(spec.get('source',src_default)) # file src or default.
         suffix = spec.get('suffix','*') # file suffix of targets.
         files = load_files(source,suffix) # files to parse.
+        # files which have already been parsed skip straight to `on_fmt`.
+        if ledger is not None:
+            files,seen = lu.split_files(ledger,source,files)
+            for fname in seen:
+                print('skipping previously parsed file: {}'.format(fname))
+                move_file(source,on_fmt,fname)
         # iteratively parse all files, moving them to
         # `on_fmt` if no errors occur, and `on_err` if
         # an exception is raised by `parser`.
         print('files: ',files) # DEBUG
-        for fname in files:
-            fpath = source + fname
+        results = iter_parsed(project,spec,parser,state,source,files,workers)
+        for fname,result in results:
             print('attempting to parse file: {}'.format(fname))
-            substate = state.get(name,{})
+            # raw copies are written to a temporary file, which only
+            # replaces the real one once the file has fully parsed.
+            partial = '.{}.part'.format(fname)
+            save = lambda r,a: save_raw(on_raw,partial,r,a) if on_raw else None
             try:
-                substate,rows = parser.parse(project,spec,substate,fpath)
-                for r in rows: assert isinstance(r,Row)
-                data += rows
+                chunks = check_chunks(result(),save)
+                (substate,count),rows = du.collect_chunks(chunks)
+                # files parsed in parallel all start from the same
+                # substate, so their substates are merged in order.
+                if workers > 1 and substate:
+                    substate = {**state.get(name,{}),**substate}
                 if substate:
                     state[name] = substate
                 else: state.pop(name,None)
-                if on_raw: save_raw(on_raw,fname,rows)
+                if on_raw: finish_raw(on_raw,partial,fname)
+                if ledger is not None: lu.record_file(ledger,source + fname)
                 move_file(source,on_fmt,fname)
-                print('{} rows acquired during parsing...\n'.format(len(rows)))
+                print('{} rows acquired during parsing...\n'.format(count))
+                if rows: yield rows
             except Exception as err:
                 print('error while parsing {}: '.format(fname) + str(err))
                 print('moving target file to: {}\n'.format(on_err))
                 mklog(project,err)
+                if on_raw: finish_raw(on_raw,partial)
                 move_file(source,on_err,fname)
-    return state,data
+    if ledger is not None:
+        opts = settings['ledger'] if isinstance(settings['ledger'],dict) else {}
+        retention = opts.get('retention',lu.RETENTION)
+        state['ledger'] = lu.dump_ledger(ledger,retention)
+
+
+# get the list of directories which parsers read files from.
+def sources(project,config):
+    settings = config.get('settings',{})
+    dir_fmt = lambda d: d if d.endswith('/') else d + '/'
+    src_default = settings.get('source','tmp/inputs/{}/'.format(project))
+    dirs = [dir_fmt(p.get('source',src_default)) for p in config['parser']]
+    return list(dict.fromkeys(dirs))
+
+
+# load the ledger of previously parsed files if enabled by
+# `settings.ledger`, which may be `true` or a table of options.
+# returns `None` if the ledger is not enabled.
+def get_ledger(settings,state):
+    if not settings.get('ledger',False):
+        return None
+    return lu.load_ledger(state.get('ledger'))
+
+
+# parse `files`, yielding tuples of the form `(fname,result)`, in
+# the same order as `files`.  calling `result` returns a stream of
+# the parser's output (see `parse_stream`).  by default, files are
+# parsed one at a time as they are consumed, with each file seeing
+# the substate left by the previous one.  if `workers` is greater
+# than one, files are parsed in a process pool instead, and each
+# file sees the substate from before any of them were parsed.
+def iter_parsed(project,spec,parser,state,source,files,workers=0):
+    name = spec['parser']
+    if workers < 2:
+        for fname in files:
+            substate = state.get(name,{})
+            fpath = source + fname
+            yield fname,lambda: parse_stream(parser,project,spec,substate,fpath)
+        return
+    substate = state.get(name,{})
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(run_parser,name,project,spec,substate,source + f)
+                for f in files]
+        for fname,job in zip(files,jobs):
+            yield fname,lambda: unpack_rows(*job.result())
+
+
+# run a parser against a single file, as a generator which yields
+# chunks of rows & returns the new substate.  parsers which expose
+# a `stream` generator of this form are used directly, while those
+# which only expose `parse` produce a single chunk.
+def parse_stream(parser,project,spec,substate,fpath):
+    if hasattr(parser,'stream'):
+        return (yield from parser.stream(project,spec,substate,fpath))
+    substate,rows = parser.parse(project,spec,substate,fpath)
+    yield rows
+    return substate
+
+
+# pass through the chunks of a parser stream, checking that all rows
+# are valid, and calling `save` (if supplied) with each chunk & a flag
+# indicating whether to append.  returns the substate & a row count.
+def check_chunks(chunks,save=None):
+    count = 0
+    while True:
+        try: rows = next(chunks)
+        except StopIteration as stop: return stop.value,count
+        for r in rows: assert isinstance(r,Row)
+        if save: save(rows,count > 0)
+        count += len(rows)
+        yield rows
+
+
+# run a parser against a single file in a worker process.  rows are
+# passed back as plain tuples, since `Row` cannot be pickled.
+def run_parser(name,project,spec,substate,fpath):
+    parser = get_parser(name)
+    stream = parse_stream(parser,project,spec,substate,fpath)
+    substate,rows = du.collect_chunks(stream)
+    for r in rows: assert isinstance(r,Row)
+    return substate,[tuple(r) for r in rows]
+
+
+# convert the output of `run_parser` back into a stream.
+def unpack_rows(substate,rows):
+    yield list(map(Row._make,rows))
+    return substate
 
 
 # save a copy of the parsed data in "raw" form to a csv,
 # without any aggregation, reshaping, etc.  The data is
 # saved to a file with the same name as its source (if the
 # source file was not a csv, the `.csv` extension is added).
-def save_raw(directory,filename,rows):
-    # add `.csv` if filename is not a csv.
-    name = filename if filename.endswith('.csv') else filename + '.csv'
+# if `append` is set, rows are added to the existing file.
+def save_raw(directory,filename,rows,append=False):
     # generate destination directory if does not exist.
     if not path.isdir(directory): os.makedirs(directory)
     # generate full filepath for destination file.
-    filepath = directory + name
+    filepath = directory + raw_name(filename)
     # use the default csv utility to save the rows.
-    fu.save_csv(filepath,rows)
+    fu.save_csv(filepath,rows,append=append)
+
+
+# move a raw copy saved under the temporary name `partial` to its
+# final name `filename`, or discard it if no `filename` is given.
+def finish_raw(directory,partial,filename=None):
+    filepath = directory + raw_name(partial)
+    if not path.isfile(filepath): return
+    if filename: os.replace(filepath,directory + raw_name(filename))
+    else: os.remove(filepath)
+
+
+# get the name of the raw copy of a file; the `.csv` extension
+# is added if the source file was not a csv.
+def raw_name(filename):
+    return filename if filename.endswith('.csv') else filename + '.csv'
 
 
 # move a file at src/name to dest/name.  If
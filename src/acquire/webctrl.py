@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 from src.core.data_utils import Row, get_uid_generator, check_config, make_time_specs
-from src.core.error_utils import error_template
+from src.core.error_utils import error_template, errdata
+import src.core.file_utils as fu
+import src.core.blob_utils as bu
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from array import array
 import requests
 import time
 
@@ -15,47 +20,66 @@ def acquire(project,config,state):
     # parameters, and generate time specifications
     # for all active sensors.
     params,times = setup(project,config,state)
+    # number of sensors to query at once (defaults to one).
+    workers = settings.get('concurrency',1)
+    if not isinstance(workers,int) or isinstance(workers,bool) or workers < 1:
+        mkerr = webctrl_error('checking configuration values for project: ' + project)
+        raise Exception(mkerr('`concurrency` must be a positive integer'))
     # generate a wrapper around `exec_query` with
     # user-supplied configurations pre-applied.
-    query = new_query(config['settings'])
-    # initialize collectors for formatted
-    # data and the new `nonce` values.
-    nonce,buffs,data = {},{},[]
-    # iteratively scrape all sensors.
-    for uid,spec in params.items():
-        # break out the webctrl-path and identity values from `spec`.
-        path,*ident = (spec[k] for k in ('path','node','name','unit'))
-        # pull start-time and maximum step from `times`. 
-        start,step = times[uid]['init'],times[uid]['step']
-        # get the buffer if it exists (default to empty list).
-        buff = times[uid].get('buff',[])
-        # query webctrl at `path` from `start` to `start` + `step`.
-        result = query(path,start,(start+step))
-        # make a generator for the `Row` type based
-        # on the supplied identity variables.
-        mkrow = lambda t,v: Row(*ident,float(t//1000),float(v))
-        # pass row generator and raw query-result to parser.
-        rows = parse_rows(mkrow,result)
-        # in the event of an empty query, set `start` value
-        # as the new nonce, so we start from same place next time.
-        if not rows:
-            nonce[uid] = start
-            continue
-        # filter out any data points already in buff.
-        for time in buff:
-            fltr = lambda r: r.timestamp != time
-            rows = list(filter(fltr,rows))
-        # filter rows by timestamp.
-        fltr = lambda r: r.timestamp
-        stamps = [fltr(r) for r in rows] # get all timestamps.
-        nonce[uid] = max(stamps) # set the new nonce value.
-        buffs[uid] = stamps + buff # set the new buff values.
-        data += rows # add our rows to `data`.
+    query = new_query(config['settings'],workers)
+    # query webctrl at `path` from `start` to `start` + `step`.
+    spans = {u: (t['init'],t['init'] + t['step']) for u,t in times.items()}
+    fetch = lambda uid: query(params[uid]['path'],*spans[uid])
+    # initialize collectors for formatted data, the new
+    # `nonce` values, and any duplicate rows.
+    nonce,buffs,data,dups = {},{},[],[]
+    # queries run in parallel, but results are yielded (and
+    # hence processed) in the same order as `params`.
+    pool = ThreadPoolExecutor(max_workers=workers)
+    results = zip(params.items(),pool.map(fetch,params))
+    try:
+        # iteratively process the results for all sensors.
+        for (uid,spec),result in results:
+            # break out the identity values from `spec`.
+            ident = [spec[k] for k in ('node','name','unit')]
+            # pull start-time from `times`.
+            start = times[uid]['init']
+            # get the buffer if it exists (default to empty list).
+            buff = times[uid].get('buff',[])
+            # make a generator for the `Row` type based
+            # on the supplied identity variables.
+            mkrow = lambda t,v: Row(*ident,float(t//1000),float(v))
+            # pass row generator and raw query-result to parser.
+            rows,drops = parse_rows(mkrow,result)
+            dups += drops
+            # in the event of an empty query, set `start` value
+            # as the new nonce, so we start from same place next time.
+            if not rows:
+                nonce[uid] = start
+                continue
+            # filter out any data points already in buff.
+            rows = exclude_times(rows,buff)
+            # if every data point was already recorded, carry
+            # the buffer forward & resume from its newest point.
+            if not rows:
+                nonce[uid] = max(buff)
+                buffs[uid] = buff
+                continue
+            # filter rows by timestamp.
+            fltr = lambda r: r.timestamp
+            stamps = [fltr(r) for r in rows] # get all timestamps.
+            nonce[uid] = max(stamps) # set the new nonce value.
+            buffs[uid] = stamps + buff # set the new buff values.
+            data += rows # add our rows to `data`.
+    # pending queries are cancelled if processing fails.
+    finally: pool.shutdown(cancel_futures=True)
     # add newly generate `nonce` to `state`, overwriting
     # old value if it exists.
     state['nonce'] = nonce
     if settings.get('rolling-buffer',False):
         state = set_buffer(settings,state,buffs)
+    handle_duplicates(project,settings,dups)
     return state,data
 
 
@@ -66,16 +90,38 @@ def parse_rows(mkrow,data):
     # extract timestamp & value, passing them to supplied row generator,
     # and filter out erroneous values (indicated by `'?'` in webctrl data).
     raw_rows = [mkrow(r['t'],r['a']) for r in data if not '?' in r.values()]
-    rows,times,dups = [],[],[] # instantiate collectors.
+    rows,times,dups = [],set(),[] # instantiate collectors.
     # iterate over rows, sorting out duplicates by timestamp.
     for row in raw_rows:
         t = row.timestamp
         if not t in times:
-            times.append(t)
+            times.add(t)
             rows.append(row)
         else: dups.append(row)
-    # TODO: optionally save duplicates to archive.
-    return rows
+    return rows,dups
+
+
+# remove all rows whose timestamp appears in `times`
+# (e.g.; the timestamps held in a rolling buffer).
+def exclude_times(rows,times):
+    if not times: return rows
+    times = set(times)
+    return [r for r in rows if not r.timestamp in times]
+
+
+# deal with duplicate rows as specified by the optional
+# `on-duplicate` setting (`discard`, `archive`, or `error`).
+def handle_duplicates(project,settings,rows):
+    if not rows: return
+    action = settings.get('on-duplicate','discard')
+    if action == 'discard': return
+    elif action == 'archive':
+        fu.save_archive(project,'duplicate',rows)
+    elif action == 'error':
+        errdata(project,rows,txt='duplicateerr')
+    else:
+        mkerr = webctrl_error('handling duplicate rows')
+        raise Exception(mkerr('unrecognized action: ' + str(action)))
 
 
 # do general housekeeping before data-acquisition
@@ -105,7 +151,7 @@ def setup(project,config,state):
 # known to serve data with periodic gaps.
 def get_buffer(settings,state,times):
     # get the previous buffer from state.
-    prev = state.get('buff',{})
+    prev = load_buffer(state.get('buff',{}))
     # load the buffer size.
     size = settings['rolling-buffer']
     # if user simply set `rolling-buffer` to true, then
@@ -116,7 +162,7 @@ def get_buffer(settings,state,times):
     for uid,spec in times.items():
         init = spec['init'] - size
         step = spec['step'] + size
-        buff = [t for t in prev.get(uid,[]) if t >= init]
+        buff = [t for t in prev[uid]() if t >= init] if uid in prev else []
         times[uid].update({'init':init,'step':step,'buff':buff})
     return times
 
@@ -134,10 +180,40 @@ def set_buffer(settings,state,buffs):
     # most recent timestamp.
     fltr = lambda b: [t for t in b if t >= (max(b)-size)]
     # set the `buff` section of `state`.
-    state['buff'] = {k: fltr(v) for k,v in buffs.items()}
+    buffs = {k: encode_times(fltr(v)) for k,v in buffs.items()}
+    state['buff'] = bu.pack_arrays(buffs)
     return state
 
 
+# load the buffer from `state` as a dict of the form
+# `{uid: loader}`, s.t. only the timestamps of uids which
+# are actually being scraped get decoded.  older state files
+# hold the buffer as a `toml` table of lists, which is used
+# as-is; `set_buffer` re-saves it in packed form.
+def load_buffer(buff):
+    if isinstance(buff,dict):
+        return {k: (lambda v=v: v) for k,v in buff.items()}
+    loaders = bu.unpack_arrays(buff)
+    return {k: (lambda l=l: decode_times(l())) for k,l in loaders.items()}
+
+
+# encode a list of timestamps as a compact array.  whole-second
+# timestamps are sorted & delta-encoded, anything else is stored
+# as plain sorted floats.
+def encode_times(times):
+    times = sorted(times)
+    if not all(t == int(t) for t in times):
+        return array('d',times)
+    ints = [int(t) for t in times]
+    return array('q',(b - a for a,b in zip([0] + ints,ints)))
+
+
+# decode an array generated by `encode_times`.
+def decode_times(arr):
+    if arr.typecode == 'd': return list(arr)
+    return [float(t) for t in accumulate(arr)]
+
+
 # initialize sensor and time parameters from
 # configuration and nonce values.  Returns two
 # dicts, both organized by uid.  One containing
@@ -170,20 +246,26 @@ def setup_parameters(project,config,nonce):
 
 # Generate a pre-configured query callable
 # s.t. we don't all die of excess boilerplate.
-def new_query(settings):
+# all queries share a single keep-alive session,
+# sized to hold one connection per worker.
+def new_query(settings,workers=1):
     tp = lambda t: time.strftime('%Y-%m-%d',time.gmtime(t))
     uri = settings['server']
     auth = ( settings['login']['name'], settings['login']['pass'] )
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+    session.mount('http://',adapter)
+    session.mount('https://',adapter)
     # return a lambda fn that executes a query given
     # the args: query-string, start-time, end-time.
-    lam = lambda q,s,e : exec_query(uri,q,auth,tp(s),tp(e))
+    lam = lambda q,s,e : exec_query(session,uri,q,auth,tp(s),tp(e))
     return lam
 
 # Actually execute the query of the webctrl server.
-def exec_query(uri,sensor,auth,start,stop):
+def exec_query(session,uri,sensor,auth,start,stop):
     print("querying: {}".format(sensor))
     params = {'id':sensor,'start':start,'end':stop,'format':'json'}
-    req = requests.post(uri,params=params,auth=tuple(auth))
+    req = session.post(uri,params=params,auth=tuple(auth))
     if req.status_code != 200:
         print(req.text)
         raise Exception("Query Failed w/ Status Code {}".format(req.status_code))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+from array import array
+import struct
+import zlib
+import sys
+
+# utilities for packing named arrays into compact binary blobs.
+# any `bytes` value placed in a `state` dict is saved as a blob
+# alongside the regular state files (see `file_utils.save_state`),
+# which keeps large numeric state out of the `toml` files.
+
+# leading bytes used to identify the blob format.
+MAGIC = b'SUB1'
+
+
+# pack a mapping of the form `{name: array}` into a
+# single compressed bytes object.
+def pack_arrays(arrays):
+    header = [MAGIC,struct.pack('<I',len(arrays))]
+    body = []
+    for name,arr in arrays.items():
+        raw = to_little(arr).tobytes()
+        enc = name.encode()
+        header.append(struct.pack('<H',len(enc)) + enc)
+        header.append(struct.pack('<cQ',arr.typecode.encode(),len(raw)))
+        body.append(raw)
+    return zlib.compress(b''.join(header + body))
+
+
+# unpack a blob generated by `pack_arrays`.  returns a dict
+# of the form `{name: loader}`, where calling `loader` decodes
+# the array.  this lets callers decode only what they need.
+def unpack_arrays(blob):
+    raw = memoryview(zlib.decompress(blob))
+    if bytes(raw[:4]) != MAGIC:
+        raise Exception('unrecognized blob format')
+    count, = struct.unpack_from('<I',raw,4)
+    pos,specs = 8,[]
+    for i in range(count):
+        size, = struct.unpack_from('<H',raw,pos)
+        name = bytes(raw[pos+2:pos+2+size]).decode()
+        pos += 2 + size
+        code,nbytes = struct.unpack_from('<cQ',raw,pos)
+        pos += 9
+        specs.append((name,code.decode(),nbytes))
+    loaders = {}
+    for name,code,nbytes in specs:
+        loaders[name] = mkloader(code,raw[pos:pos+nbytes])
+        pos += nbytes
+    return loaders
+
+
+# generate a loader for a single array.
+def mkloader(typecode,raw):
+    def load():
+        arr = array(typecode)
+        arr.frombytes(raw)
+        return to_little(arr)
+    return load
+
+
+# arrays are stored little-endian regardless of platform.
+def to_little(arr):
+    if sys.byteorder == 'little': return arr
+    arr = array(arr.typecode,arr)
+    arr.byteswap()
+    return arr
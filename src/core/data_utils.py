@@ -2,6 +2,9 @@
 import src.core.file_utils as file_utils
 import src.core.error_utils as error_utils
 from collections import namedtuple
+from itertools import islice,repeat
+from operator import itemgetter
+from functools import partial
 import time
 import toml
 import os.path as path
@@ -24,9 +27,9 @@ def fmt_string(target):
     return formatted
 
 def row_generator(node,name,unit):
-    node = fmt_string(node)
-    name = fmt_string(name)
-    unit = fmt_string(unit)
+    node = sys.intern(fmt_string(node))
+    name = sys.intern(fmt_string(name))
+    unit = sys.intern(fmt_string(unit))
     gen = lambda t,v: Row(node,name,unit,float(t),float(v))
     return gen
 
@@ -36,18 +39,43 @@ def custom_row_generator(fields):
     return generator
 
 
+# uids by key, shared by all uid generators.  of the form
+# `{key: {identity: uid}}`, where `identity` is the tuple of
+# key field values.  uids are interned, so that each distinct
+# identity is formatted once & stored once.
+uid_cache = {}
+
+# maximum number of identities cached for a single key.
+UID_CACHE_SIZE = 65536
+
+
 # get a uid generator based on an ordered mapping of fields.
 def get_uid_generator(key=None):
     default = ['node','name','unit']
     if not key: key = default
     fields = Row._fields
-    fmt = lambda l: '-'.join(l).lower()
     indexes = []
     for item in key:
         indexes.append(fields.index(item))
-    mkuid = lambda row: fmt((row[i] for i in indexes))
+    getkey = itemgetter(*indexes) if len(indexes) > 1 else lambda r: (r[indexes[0]],)
+    cache = uid_cache.setdefault(tuple(key),{})
+    mkuid = lambda row: cached_uid(cache,getkey(row))
     return mkuid
 
+
+# get the uid of an identity tuple from `cache`, adding it if needed.
+def cached_uid(cache,ident):
+    uid = cache.get(ident)
+    if uid is None:
+        if len(cache) >= UID_CACHE_SIZE: cache.clear()
+        uid = cache[ident] = sys.intern('-'.join(ident).lower())
+    return uid
+
+
+# get the uids of rows, in order.
+def get_uids(rows,key=None):
+    return map(get_uid_generator(key),rows)
+
 # check a configuration file against a prototype
 # of its expected fields and types.  `ident` must be
 # the enclosing field name of the configuration value,
@@ -107,41 +135,100 @@ def update_row(mapping,row,constructor=Row):
     return newrow
 
 
+# equivalent to calling `update_row` on each of `rows`, but
+# rebuilds the rows column-wise.
+def update_rows(mapping,rows,constructor=Row):
+    if not rows: return []
+    fields = constructor._fields
+    for field in mapping:
+        if not field in fields:
+            raise Exception('unrecognized field: ' + field)
+    columns = list(zip(*rows))
+    for field,value in mapping.items():
+        columns[fields.index(field)] = repeat(value)
+    build = partial(tuple.__new__,constructor)
+    return list(map(build,zip(*columns)))
+
+
 # sort rows into matching and non-matching list
 # based upon a dict of form { field: matchstring }.
+# rows are checked in a single pass; non-matching rows
+# are grouped by the first field which they fail to match.
 def match_rows(spec,rows,rowtype=Row):
+    indexes,first_miss = compile_matcher(spec,rowtype)
+    misses = classify_rows(first_miss,indexes,rows)
+    targets,removed = [],[[] for field in spec]
+    append = {None: targets.append}
+    append.update((pos,rems.append) for pos,rems in enumerate(removed))
+    for row,miss in zip(rows,misses):
+        append[miss](row)
+    return targets,[r for rems in removed for r in rems]
+
+# compile a dict of form { field: matchstring } into a function
+# which returns the position (within `spec`) of the first field
+# that a row fails to match, or `None` if all fields match.
+# returns the indexes of the fields checked, and the function.
+def compile_matcher(spec,rowtype=Row):
     fields = rowtype._fields
-    targets = [r for r in rows]
-    removed = []
+    tests = []
     for field in spec:
         if not field in fields:
             raise Exception('unrecognized field in matcher: ' + field)
-        target = spec[field]
-        index = fields.index(field)
-        fltr = make_row_matcher(target,index)
-        targets,removals = split_rows(fltr,targets)
-        removed += removals
-    return targets,removed
+        tests.append((fields.index(field),make_value_matcher(spec[field])))
+    def first_miss(row):
+        for pos,(index,test) in enumerate(tests):
+            if not test(row[index]): return pos
+        return None
+    return [i for i,t in tests],first_miss
+
+# apply `fn` to rows, calling it only once per distinct combination
+# of values at `indexes` (`fn` sees a row with only those fields
+# filled in).  returns an iterator over the results in row order.
+def classify_rows(fn,indexes,rows):
+    indexes = sorted(set(indexes))
+    if not indexes: return (fn(()) for row in rows)
+    getkey = itemgetter(*indexes)
+    multi = len(indexes) > 1
+    def proxy(key):
+        row = [None] * (indexes[-1] + 1)
+        for i,v in zip(indexes,key if multi else (key,)): row[i] = v
+        return fn(row)
+    return map(Memo(proxy).__getitem__,map(getkey,rows))
+
+
+# dict which fills in missing keys by calling `fn`.
+class Memo(dict):
+    def __init__(self,fn):
+        self.fn = fn
+
+    def __missing__(self,key):
+        value = self[key] = self.fn(key)
+        return value
 
 # generate a row filter based upon a match-string and
 # an index.  Ex: the args `(0,"*foo")` would generate
 # a filter that returns true for any row whose first
 # element ends with `foo`.
 def make_row_matcher(target,index):
-    match = target.replace('*','')
-    sw = lambda s,m: s.lower().startswith(m.lower())
-    ew = lambda s,m: s.lower().endswith(m.lower())
+    test = make_value_matcher(target)
+    fltr = lambda r: test(r[index])
+    return fltr
+
+# generate a value filter based upon a match-string.
+# the pattern is lowered once, rather than per check.
+def make_value_matcher(target):
+    match = target.replace('*','').lower()
     if not '*' in target:
-        fltr = lambda r: match.lower() == r[index].lower()
-    elif sw(target,'*') and ew(target,'*'):
-        fltr = lambda r: match.lower() in r[index].lower()
-    elif sw(target,'*'):
-        fltr = lambda r: ew(r[index],match)
-    elif ew(target,'*'):
-        fltr = lambda r: sw(r[index],match)
+        test = lambda v: match == v.lower()
+    elif target.startswith('*') and target.endswith('*'):
+        test = lambda v: match in v.lower()
+    elif target.startswith('*'):
+        test = lambda v: v.lower().endswith(match)
+    elif target.endswith('*'):
+        test = lambda v: v.lower().startswith(match)
     else:
         raise Exception('invalid match string: ' + target)
-    return fltr
+    return test
 
 
 # map a function across a specific field of
@@ -151,12 +238,55 @@ def map_rows(fn,target,rows,constructor=Row):
     if not target in fields:
         raise Exception('unrecognized field: ' + target)
     index = fields.index(target)
-    mapped = []
-    for row in rows:
-        vals = list(row)
-        vals[index] = fn(vals[index])
-        mapped.append(constructor(*vals))
-    return mapped
+    values = map(fn,map(itemgetter(index),rows))
+    return replace_column(target,values,rows,constructor)
+
+
+# rebuild rows with the values of the `target` field replaced
+# by `values`.  rows are rebuilt column-wise, without any
+# python-level work per row.
+def replace_column(target,values,rows,constructor=Row):
+    index = constructor._fields.index(target)
+    columns = list(zip(*rows))
+    if not columns: return []
+    columns[index] = values
+    build = partial(tuple.__new__,constructor)
+    return list(map(build,zip(*columns)))
+
+
+# group rows by uid.  returns an index of the form
+# `{'groups': {uid: [row,...]}, 'ordered': bool}`.  groups appear
+# in the order their uids are first seen, and rows keep their
+# relative order.  `ordered` is set if the rows are exactly the
+# concatenation of the groups (e.g.; rows were already grouped).
+def index_rows(rows,key=None):
+    groups,ordered,last = {},True,None
+    for uid,row in zip(get_uids(rows,key),rows):
+        if uid != last:
+            if uid in groups: ordered = False
+            else: groups[uid] = []
+            last = uid
+        groups[uid].append(row)
+    return {'groups': groups, 'ordered': ordered}
+
+
+# split an iterable into lists of at most `size` elements.
+def chunk_iter(items,size):
+    items = iter(items)
+    chunk = list(islice(items,size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items,size))
+
+
+# consume a generator which yields lists of rows & returns some
+# final value (e.g.; a streaming parser).  returns the final
+# value along with all of the rows.
+def collect_chunks(chunks):
+    rows = []
+    while True:
+        try: rows += next(chunks)
+        except StopIteration as stop: return stop.value,rows
 
 
 # split rows by a pass/fail function.
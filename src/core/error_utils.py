@@ -35,7 +35,9 @@ def mklog(project,text):
         write(ftr)
 
 # write a csv of improperly formatted
-# data to an appropriate errors file.
+# data to an appropriate errors file.  rows are
+# appended if the file already exists, as when
+# rows are written a chunk at a time.
 def errdata(project,data,txt='fmterr'):
     if not data: return
     # check appropriate error directory
@@ -45,11 +47,12 @@ def errdata(project,data,txt='fmterr'):
     fpath = errdir + txt + '-'+ str(int(time.time())) + '.csv'
     # extract field names from data.
     fields = data[0]._fields
+    new = not path.isfile(fpath)
     # write data to csv.
-    with open(fpath,'w') as fp:
+    with open(fpath,'a') as fp:
         print('writing {} malformed rows to: {}'.format(len(data),fpath))
         writer = csv.writer(fp)
-        writer.writerow(fields)
+        if new: writer.writerow(fields)
         for d in data: writer.writerow(d)
 
 # Setup error directories if necessary.
@@ -43,20 +43,63 @@ def get_state(project):
         with open(directory + f) as fp:
             data = parse(fp)
         state[name] = data
+    # binary blobs are re-inserted at the location
+    # described by their file name, e.g.; the file
+    # `foo.bar.bin` is loaded into `state['foo']['bar']`.
+    for f in match_filetype(files,'bin'):
+        *keys,last = f.split('.')[:-1]
+        target = state
+        for key in keys:
+            target = target.setdefault(key,{})
+        with open(directory + f,'rb') as fp:
+            target[last] = fp.read()
     return state
 
 
 # save all elements of the current state object.
+# any `bytes` values are split out into separate
+# binary files, as they cannot be stored as `toml`.
+# `.toml` & `.bin` files of keys which are no longer
+# in state (e.g.; emptied by a step) are removed.
 def save_state(project,state):
     directory = 'tmp/projects/{}/state-files/'.format(project)
     if not path.isdir(directory):
         os.makedirs(directory)
+    saved = []
     for key in state:
         val = state[key]
         if not val: continue
+        val,blobs = split_blobs(val,key)
+        for name,blob in blobs.items():
+            fname = '{}.bin'.format(name)
+            with open(directory + fname,'wb') as fp:
+                fp.write(blob)
+            saved.append(fname)
+        if not val: continue
         fname = '{}.toml'.format(key)
         with open(directory + fname,'w') as fp:
             toml.dump(val,fp)
+        saved.append(fname)
+    # remove any files which are no longer part of state, so
+    # that stale values are not loaded again on the next run.
+    files = list_files(directory)
+    for f in match_filetype(files,'bin') + match_filetype(files,'toml'):
+        if not f in saved: os.remove(directory + f)
+
+
+# recursively separate `bytes` values from a dict.  returns a
+# copy of the dict without said values, and a dict of the form
+# `{'dotted.path': value}` containing the separated values.
+def split_blobs(data,prefix):
+    if isinstance(data,bytes): return None,{prefix: data}
+    if not isinstance(data,dict): return data,{}
+    collector,blobs = {},{}
+    for key,val in data.items():
+        val,sub = split_blobs(val,'{}.{}'.format(prefix,key))
+        blobs.update(sub)
+        if val is None and sub: continue
+        collector[key] = val
+    return collector,blobs
 
 
 # recursively expand all `-file` fields
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import src.core.blob_utils as blob_utils
+from hashlib import blake2b
+from bisect import bisect_left
+from array import array
+import time
+
+# numpy is optional; if available, buckets are
+# probed with a single vectorized search each.
+try: import numpy as np
+except ImportError: np = None
+
+# an on-disk index of recently exported rows.  exports use
+# this to drop rows which have already been delivered before
+# they reach the destination.  rows are stored as 64-bit hashes
+# of their key, grouped into buckets by the hour in which they
+# were exported, so that whole buckets expire at once.
+
+# width of a single bucket (in seconds).
+BUCKET = 3600
+
+# default age at which buckets are expired (one week).
+EXPIRE = 604800
+
+
+# get a function which hashes the `key` fields of a row.
+# all fields are used if no key is supplied.
+def hash_generator(fields,key=None):
+    fields = list(fields)
+    key = key if key else fields
+    indexes = []
+    for field in key:
+        if not field in fields:
+            raise Exception('unknown index key field: ' + field)
+        indexes.append(fields.index(field))
+    digest = lambda s: blake2b(s.encode(),digest_size=8).digest()
+    mkkey = lambda row: str(tuple((row[i] for i in indexes)))
+    mkhash = lambda row: int.from_bytes(digest(mkkey(row)),'little')
+    return mkhash
+
+
+# load an index from its packed form.  returns a
+# dict of the form `{bucket: array-of-hashes}`.
+def load_index(blob):
+    if not blob: return {}
+    loaders = blob_utils.unpack_arrays(blob)
+    return {int(b): load() for b,load in loaders.items()}
+
+
+# pack an index for storage in `state`.
+def dump_index(index):
+    arrays = {str(b): index[b] for b in sorted(index)}
+    return blob_utils.pack_arrays(arrays)
+
+
+# split rows into those which are not yet in the
+# index, and those which have already been seen.
+def filter_rows(index,rows,mkhash):
+    hashes = list(map(mkhash,rows))
+    seen = probe_index(index,hashes)
+    fresh,skipped = [],[]
+    for row,hit in zip(rows,seen):
+        if hit: skipped.append(row)
+        else: fresh.append(row)
+    return fresh,skipped
+
+
+# check which of `hashes` are in the index, by searching each of
+# the (sorted) bucket arrays in place.  returns a list of bools.
+def probe_index(index,hashes):
+    buckets = [b for b in index.values() if len(b)]
+    if np is not None:
+        query = np.array(hashes,dtype=np.uint64)
+        hits = np.zeros(len(query),dtype=bool)
+        for bucket in buckets:
+            arr = np.frombuffer(bucket,dtype=np.uint64)
+            pos = np.minimum(np.searchsorted(arr,query),len(arr) - 1)
+            hits |= arr[pos] == query
+        return hits.tolist()
+    found = set()
+    for bucket in buckets:
+        for h in set(hashes) - found:
+            i = bisect_left(bucket,h)
+            if i < len(bucket) and bucket[i] == h: found.add(h)
+    return [h in found for h in hashes]
+
+
+# add hashes to the current bucket, and drop
+# all buckets older than `expire` seconds.
+def update_index(index,hashes,expire=EXPIRE):
+    now = time.time()
+    bucket = int(now // BUCKET)
+    oldest = int((now - expire) // BUCKET)
+    current = set(index.get(bucket,()))
+    current.update(hashes)
+    index[bucket] = array('Q',sorted(current))
+    return {b: h for b,h in index.items() if b >= oldest}
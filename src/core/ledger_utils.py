@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import src.core.blob_utils as blob_utils
+from hashlib import blake2b
+from array import array
+import os.path as path
+import time
+import os
+
+# a ledger of files which have already been parsed.  files are
+# identified by a hash of their contents, so that a file copied
+# back into an input directory is recognized even if it has
+# been renamed.  hashing is only done when a cheaper check is
+# inconclusive: a file whose size & mtime both match the ledger
+# entry recorded for the same path is assumed to be the same file,
+# and a file whose size matches no entry is assumed to be new.
+
+# default age at which entries are expired (thirty days).
+RETENTION = 2592000
+
+# size of content hashes (in bytes).
+DIGEST = 16
+
+# separator used when packing paths into a single array.
+SEP = '\0'
+
+
+# load a ledger from its packed form.  returns a dict of the
+# form `{digest: (size,mtime,seen,path)}`.  ledgers saved before
+# paths were recorded load with empty paths.
+def load_ledger(blob):
+    if not blob: return {}
+    loaders = blob_utils.unpack_arrays(blob)
+    digests = loaders['digest']().tobytes()
+    digests = [digests[i:i+DIGEST] for i in range(0,len(digests),DIGEST)]
+    if 'path' in loaders:
+        paths = loaders['path']().tobytes().decode().split(SEP)
+    else: paths = [''] * len(digests)
+    fields = zip(loaders['size'](),loaders['mtime'](),loaders['seen'](),paths)
+    return dict(zip(digests,fields))
+
+
+# pack a ledger for storage in `state`, dropping all
+# entries recorded more than `retention` seconds ago.
+def dump_ledger(ledger,retention=RETENTION):
+    oldest = time.time() - retention
+    keep = [(d,e) for d,e in ledger.items() if e[2] >= oldest]
+    arrays = {
+        'digest': array('B',b''.join(d for d,e in keep)),
+        'size': array('q',(e[0] for d,e in keep)),
+        'mtime': array('q',(e[1] for d,e in keep)),
+        'seen': array('d',(e[2] for d,e in keep)),
+        'path': array('B',SEP.join(e[3] for d,e in keep).encode())
+        }
+    return blob_utils.pack_arrays(arrays)
+
+
+# split files in `directory` into those which need to be parsed,
+# and those whose contents are already in the ledger.  identical
+# files within the same batch are also caught, with the first
+# being parsed & the rest being treated as already seen.
+def split_files(ledger,directory,files):
+    stats = {f: os.stat(path.join(directory,f)) for f in files}
+    quick = {}
+    for e in ledger.values():
+        quick.setdefault(e[3],set()).add((e[0],e[1]))
+    sizes = {e[0] for e in ledger.values()}
+    counts = {}
+    for st in stats.values():
+        counts[st.st_size] = counts.get(st.st_size,0) + 1
+    fresh,seen,batch = [],[],set()
+    for fname in files:
+        st = stats[fname]
+        if (st.st_size,st.st_mtime_ns) in quick.get(path.join(directory,fname),()):
+            seen.append(fname)
+        elif not st.st_size in sizes and counts[st.st_size] < 2:
+            fresh.append(fname)
+        else:
+            digest = file_digest(path.join(directory,fname))
+            if digest in ledger or digest in batch:
+                seen.append(fname)
+            else: fresh.append(fname)
+            batch.add(digest)
+    return fresh,seen
+
+
+# add a successfully parsed file to the ledger.
+def record_file(ledger,filepath):
+    st = os.stat(filepath)
+    digest = file_digest(filepath)
+    ledger[digest] = (st.st_size,st.st_mtime_ns,time.time(),filepath)
+
+
+# hash the contents of a file.
+def file_digest(filepath):
+    hasher = blake2b(digest_size=DIGEST)
+    with open(filepath,'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20),b''):
+            hasher.update(block)
+    return hasher.digest()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import src.core.blob_utils as blob_utils
+from array import array
+
+# a compact store for the partially collected inputs of value
+# generators.  partials are held in memory in the same form as
+# the generator sortings, i.e.; `{gid: {tid: {'add': {uid: value},
+# 'sub': {uid: value}}}}`, and stored as one set of time-sorted
+# arrays per generator, so that only the generators which are
+# actually run need to be decoded.
+
+# default age (in seconds, relative to the newest time seen by a
+# generator) at which the partials of generators with a `tolerance`
+# are expired (thirty days).  partials of other generators are only
+# expired if an `expire` time is configured.
+EXPIRE = 2592000
+
+# separator used when packing strings into a single array.
+SEP = '\0'
+
+
+# load partials from their packed form.  returns a dict of the
+# form `{gid: loader}`, where calling `loader` decodes the partials
+# of that generator.  partials saved as a plain dict by earlier
+# versions are accepted as well, so existing state carries over.
+def load_partials(blob):
+    if not blob: return {}
+    if isinstance(blob,dict):
+        return {gid: (lambda p=p: p) for gid,p in blob.items()}
+    loaders = blob_utils.unpack_arrays(blob)
+    gids = unpack_strings(loaders['gids']())
+    uids = unpack_strings(loaders['uids']())
+    fields = lambda i: [loaders['{}.{}'.format(f,i)] for f in ('time','uid','sub','value')]
+    return {gid: mkloader(uids,*fields(i)) for i,gid in enumerate(gids)}
+
+
+# generate a loader for the partials of a single generator.
+def mkloader(uids,times,codes,subs,values):
+    def load():
+        points = {}
+        for t,c,s,v in zip(times(),codes(),subs(),values()):
+            tid = str(t)
+            if not tid in points: points[tid] = {'add': {}, 'sub': {}}
+            points[tid]['sub' if s else 'add'][uids[c]] = v
+        return points
+    return load
+
+
+# pack partials for storage in `state`.
+def dump_partials(partials):
+    gids = [gid for gid in partials if partials[gid]]
+    codes,arrays = {},{}
+    for i,gid in enumerate(gids):
+        points = sorted(partials[gid].items(),key=lambda p: int(p[0]))
+        fields = {
+            'time': array('q'), 'uid': array('I'),
+            'sub': array('B'), 'value': array('d')
+            }
+        for tid,point in points:
+            for action in ('add','sub'):
+                for uid,val in point.get(action,{}).items():
+                    fields['time'].append(int(tid))
+                    fields['uid'].append(codes.setdefault(uid,len(codes)))
+                    fields['sub'].append(action == 'sub')
+                    fields['value'].append(val)
+        for name,arr in fields.items():
+            arrays['{}.{}'.format(name,i)] = arr
+    arrays['gids'] = pack_strings(gids)
+    arrays['uids'] = pack_strings(codes)
+    return blob_utils.pack_arrays(arrays)
+
+
+# pack a sequence of strings into a single byte array.
+def pack_strings(strings):
+    return array('B',SEP.join(strings).encode())
+
+
+# unpack a byte array generated by `pack_strings`.
+def unpack_strings(arr):
+    raw = arr.tobytes().decode()
+    return raw.split(SEP) if raw else []
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+from contextlib import contextmanager
+import time
+
+# utilities for sharing database connections across exports
+# & projects.  a pool is a simple dict which is owned by the
+# runtime for the duration of a single invocation.  idle
+# connections are kept under a key describing the settings
+# they were opened with, and are health-checked before reuse.
+# connections are expected to follow the `psycopg2` api.
+
+
+# generate a new pool.  `limit` is the maximum number of
+# open connections, and `check` is the number of seconds
+# a connection may sit idle before being pinged on reuse.
+def new_pool(limit=4,check=30):
+    return {'limit': limit, 'check': check, 'open': 0, 'idle': []}
+
+
+# context manager which checks out a connection matching
+# `key` (opening one with `connect` if needed), and
+# returns it to the pool once the block exits.
+@contextmanager
+def connection(pool,key,connect):
+    con = get_connection(pool,key,connect)
+    try: yield con
+    finally: put_connection(pool,key,con)
+
+
+# get a healthy idle connection for `key` if one exists,
+# otherwise open a new one.  if the pool is at its limit,
+# the least recently used idle connection is closed.
+def get_connection(pool,key,connect):
+    idle = pool['idle']
+    # search most recently used connections first.
+    for i in reversed(range(len(idle))):
+        k,con,used = idle[i]
+        if k != key: continue
+        idle.pop(i)
+        if is_healthy(con,time.time() - used,pool['check']):
+            return con
+        discard(pool,con)
+    if pool['open'] >= pool['limit']:
+        if not idle:
+            msg = 'connection limit reached ({} open)'
+            raise Exception(msg.format(pool['open']))
+        k,con,used = idle.pop(0)
+        discard(pool,con)
+    con = connect()
+    pool['open'] += 1
+    return con
+
+
+# return a connection to the pool, ending any transaction
+# left open.  broken connections are discarded.
+def put_connection(pool,key,con):
+    try:
+        if not con.closed: con.rollback()
+    except Exception: pass
+    if con.closed:
+        discard(pool,con)
+        return
+    pool['idle'].append((key,con,time.time()))
+
+
+# check that a connection is still usable.  connections
+# which have been idle for longer than `check` seconds
+# are pinged with a trivial query.
+def is_healthy(con,age,check):
+    if con.closed: return False
+    if age < check: return True
+    try:
+        with con.cursor() as cur:
+            cur.execute('SELECT 1')
+        con.rollback()
+    except Exception: return False
+    return not con.closed
+
+
+# close a connection & remove it from the open count.
+def discard(pool,con):
+    try: con.close()
+    except Exception: pass
+    pool['open'] -= 1
+
+
+# close all idle connections held by the pool.
+def close_pool(pool):
+    while pool['idle']:
+        k,con,used = pool['idle'].pop()
+        discard(pool,con)
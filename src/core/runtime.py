@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 from importlib import import_module
 import src.core.file_utils as file_utils
+import src.core.data_utils as data_utils
 import src.core.error_utils as error_utils
+import src.core.pool_utils as pool_utils
+import src.core.watch_utils as watch_utils
 
 
 # primary entry point for runtime.
@@ -9,6 +12,61 @@ import src.core.error_utils as error_utils
 # and a bool indicated wether or not to run
 # pgrm wrapped in a try/catch with logging.
 def run(proj='all',wrap=False):
+    torun = get_torun(proj)
+    # connection pool shared by all projects in this run.
+    pool = pool_utils.new_pool()
+    # alias the appropriate run function as `runit`.
+    runit = lambda p: run_wrapped(p,pool) if wrap else run_project(p,pool)
+    print('running {} projects...\n'.format(len(torun)))
+    # iteratively run all projects.
+    try:
+        for project in torun:
+            runit(project)
+    finally: pool_utils.close_pool(pool)
+
+
+# long-running alternative to `run`, which watches the source
+# directories of all projects using the `static` acquire method,
+# and runs only that method whenever new files arrive.  files
+# are given `quiet` seconds without activity to finish writing.
+# imported utilities & the connection pool stay warm between runs.
+def watch(proj='all',wrap=False,quiet=2):
+    torun = get_torun(proj)
+    static = get_util('acquire','static')
+    # mapping of form {directory: [project,...]}
+    dirs = {}
+    for project in torun:
+        config = file_utils.get_config(project)
+        acquire = config.get('acquire',{})
+        if not (is_active(config) and is_active(acquire.get('static'))):
+            continue
+        for d in static.sources(project,acquire['static']):
+            dirs.setdefault(d,[]).append(project)
+    if not dirs:
+        raise Exception('no active `static` projects to watch')
+    projects = list(dict.fromkeys(p for d in dirs for p in dirs[d]))
+    pool = pool_utils.new_pool()
+    methods = ['static']
+    runit = lambda p: run_wrapped(p,pool,methods) if wrap else run_project(p,pool,methods)
+    watcher = watch_utils.new_watcher(list(dirs))
+    mode = 'inotify' if 'fd' in watcher else 'polling'
+    print('watching {} directories ({})...\n'.format(len(dirs),mode))
+    try:
+        # pick up any files which arrived while not watching.
+        for project in projects: runit(project)
+        while True:
+            changed = watch_utils.wait_changes(watcher)
+            changed |= watch_utils.wait_quiet(watcher,quiet)
+            ready = [p for p in projects if any(p in dirs[d] for d in changed)]
+            for project in ready: runit(project)
+    except KeyboardInterrupt: print('stopping watch...\n')
+    finally:
+        watch_utils.close_watcher(watcher)
+        pool_utils.close_pool(pool)
+
+
+# resolve the `proj` argument of `run` to a list of projects.
+def get_torun(proj):
     projects = file_utils.get_projects()
     torun = projects if proj == 'all' else proj
     if not isinstance(torun,list): torun = [torun]
@@ -16,20 +74,15 @@ def run(proj='all',wrap=False):
         if not project in projects:
             err = 'could not find project folder matching: '
             raise Exception(err + str(project))
-    # alias the appropriate run function as `runit`.
-    runit = lambda p: run_wrapped(p) if wrap else run_project(p)
-    print('running {} projects...\n'.format(len(torun)))
-    # iteratively run all projects.
-    for project in torun:
-        runit(project)
+    return torun
 
 
 # wrapper around `run_project` which catches
 # and logs any errors that arise during the
 # running of the project.
-def run_wrapped(project):
+def run_wrapped(project,pool=None,methods=None):
     try:
-        run_project(project)
+        run_project(project,pool,methods)
     except Exception as err:
         print('exception in {}:'.format(project))
         print(str(err) + '\n')
@@ -39,7 +92,9 @@ def run_wrapped(project):
 # runs a single project, handling all necessary
 # initialization & cleanup.  can be called externally
 # with a string matching some existent project folder.
-def run_project(project):
+# `pool` is an optional connection pool shared between projects,
+# and `methods` optionally limits which acquire methods are run.
+def run_project(project,pool=None,methods=None):
     # load the configuration file.
     config = file_utils.get_config(project)
     if not is_active(config):
@@ -50,17 +105,27 @@ def run_project(project):
     state = file_utils.get_state(project)
     # check configuration for required fields.
     check_config(project,config)
+    # optionally pass rows between steps in chunks (see `run_streaming`).
+    if config.get('settings',{}).get('streaming',False):
+        state = run_streaming(project,config,state,pool,methods)
+    else: state = run_steps(project,config,state,pool,methods)
+    # save/update the state file(s).
+    file_utils.save_state(project,state)
+    print('finished project: {}\n'.format(project))
+
+
+
+# run the acquire, reshape & export steps in turn,
+# each over the full set of rows.
+def run_steps(project,config,state,pool=None,methods=None):
     # acquire data & updated state values.
-    state,data = acquire_data(project,config['acquire'],state)
+    state,data = acquire_data(project,config['acquire'],state,methods)
     # add any generated rows.
     # reshape the data into the desired form.
     state,data = reshape_data(project,config,state,data)
     # push data to one or more destinations.
-    state = export_data(project,config,state,data)
-    # save/update the state file(s).
-    file_utils.save_state(project,state)
-    print('finished project: {}\n'.format(project))
-
+    state = export_data(project,config,state,data,pool)
+    return state
 
 
 # Check config file for existence
@@ -75,9 +140,10 @@ def check_config(project,config):
 
 # Acquire the data via specifid method.
 # Returns data and a new state value.
-def acquire_data(project,config,state):
+def acquire_data(project,config,state,methods=None):
     data = []
     for method in config:
+        if methods is not None and not method in methods: continue
         if not is_active(config[method]):
             print('skipping acquire method: ',method)
             print('(flagged as inactive)\n')
@@ -98,6 +164,30 @@ def reshape_data(project,config,state,data):
     if 'reshape' in config:
         config = config['reshape']
     else: return state,data
+    rutils,rord = get_reshapers(config)
+    # rows grouped by uid, shared by consecutive utilities which
+    # declare `INDEXED` & keep it in sync with the data.  any other
+    # utility may change the data arbitrarily, so it is discarded.
+    index = None
+    # run all reshape utilities across data.
+    for rs in rord:
+        substate = state.get(rs,{})
+        subconf = config[rs] if isinstance(config[rs],dict) else {}
+        if getattr(rutils[rs],'INDEXED',False):
+            if index is None: index = data_utils.index_rows(data)
+            substate,data = rutils[rs].reshape(project,subconf,substate,data,index=index)
+            if index['groups'] is None: index = None
+        else:
+            substate,data = rutils[rs].reshape(project,subconf,substate,data)
+            index = None
+        if substate: state[rs] = substate
+        else: state.pop(rs,None)
+    return state,data
+
+
+# load all active reshape utilities, returning a dict of the
+# form `{kind: module}` & the kinds sorted by their ORD variable.
+def get_reshapers(config):
     rutils = {}
     rord = []
     # assemble list of active reshape mappings.
@@ -108,18 +198,12 @@ def reshape_data(project,config,state,data):
     # sort reshape utilites by their ORD variable.
     skey = lambda k: rutils[k].ORD
     rord = sorted(rord,key=skey)
-    # run all reshape utilities across data.
-    for rs in rord:
-        substate = state.get(rs,{})
-        subconf = config[rs] if isinstance(config[rs],dict) else {}
-        substate,data = rutils[rs].reshape(project,subconf,substate,data)
-        if substate: state[rs] = substate
-        else: state.pop(rs,None)
-    return state,data
+    return rutils,rord
 
 
-# Save the data via specified channel(s).
-def export_data(project,config,state,data):
+# Save the data via specified channel(s).  Utilities which
+# declare `POOLED` are handed the shared connection pool.
+def export_data(project,config,state,data,pool=None):
     if not data:
         print('no values to export.')
         return state
@@ -131,9 +215,121 @@ def export_data(project,config,state,data):
         subconf = config[kind] if isinstance(config[kind],dict) else {}
         # load & run specified export utility.
         exutil = get_util('export',kind)
-        substate = exutil.export(project,subconf,substate,data)
+        if getattr(exutil,'POOLED',False):
+            substate = exutil.export(project,subconf,substate,data,pool=pool)
+        else: substate = exutil.export(project,subconf,substate,data)
+        if substate: state[kind] = substate
+        else: state.pop(kind,None)
+    return state
+
+# streaming alternative to the `acquire_data`, `reshape_data` &
+# `export_data` sequence.  rows are passed from step to step in
+# chunks, so that only a few chunks need be held in memory at once.
+# acquire methods may supply an `iter_acquire` generator, reshape
+# utilities a `stream` generator (used if `streamable(config)` holds),
+# and exports a `sink` coroutine.  anything else needs all of the rows
+# at once, so it acts as a barrier which collects all prior chunks.
+def run_streaming(project,config,state,pool=None,methods=None):
+    chunks = iter_acquired(project,config['acquire'],state,methods)
+    chunks = iter_reshaped(project,config,state,chunks)
+    return export_chunks(project,config,state,chunks,pool)
+
+
+# chunked form of `acquire_data`.  `state` is updated in
+# place as each acquire method finishes.
+def iter_acquired(project,config,state,methods=None):
+    count = 0
+    for method in config:
+        if methods is not None and not method in methods: continue
+        if not is_active(config[method]):
+            print('skipping acquire method: ',method)
+            print('(flagged as inactive)\n')
+            continue
+        substate = state.get(method,{})
+        scraper = get_util('acquire',method)
+        if hasattr(scraper,'iter_acquire'):
+            chunks = scraper.iter_acquire(project,config[method],substate)
+        else:
+            substate,rows = scraper.acquire(project,config[method],substate)
+            chunks = [rows]
+        for rows in chunks:
+            if not rows: continue
+            count += len(rows)
+            yield rows
+        if substate: state[method] = substate
+        else: state.pop(method,None)
+    print('{} rows generated during `acquire` step.'.format(count))
+
+
+# chunked form of `reshape_data`.  returns a new iterator
+# of chunks, with each reshape utility as a stage.
+def iter_reshaped(project,config,state,chunks):
+    if not 'reshape' in config: return chunks
+    config = config['reshape']
+    rutils,rord = get_reshapers(config)
+    for rs in rord:
+        subconf = config[rs] if isinstance(config[rs],dict) else {}
+        rutil = rutils[rs]
+        if hasattr(rutil,'stream') and rutil.streamable(subconf):
+            chunks = stream_stage(project,rs,rutil,subconf,state,chunks)
+        else: chunks = barrier_stage(project,rs,rutil,subconf,state,chunks)
+    return chunks
+
+
+# run a reshape utility over each chunk in turn.
+def stream_stage(project,kind,rutil,config,state,chunks):
+    substate = state.get(kind,{})
+    substate = yield from rutil.stream(project,config,substate,chunks)
+    if substate: state[kind] = substate
+    else: state.pop(kind,None)
+
+
+# run a reshape utility over all chunks at once.
+def barrier_stage(project,kind,rutil,config,state,chunks):
+    data = [row for rows in chunks for row in rows]
+    if not data: return
+    substate = state.get(kind,{})
+    substate,data = rutil.reshape(project,config,substate,data)
+    if substate: state[kind] = substate
+    else: state.pop(kind,None)
+    if data: yield data
+
+
+# chunked form of `export_data`.  exports which supply a `sink`
+# are sent each chunk as it arrives, followed by `None`, at which
+# point they return their state.  all other exports are run once
+# all chunks have been collected.
+def export_chunks(project,config,state,chunks,pool=None):
+    config = config['export']
+    sinks,collect = {},{}
+    for kind in config:
+        if not is_active(config[kind]): continue
+        substate = state.get(kind,{})
+        subconf = config[kind] if isinstance(config[kind],dict) else {}
+        exutil = get_util('export',kind)
+        if not hasattr(exutil,'sink'):
+            collect[kind] = config[kind]
+            continue
+        if getattr(exutil,'POOLED',False):
+            sink = exutil.sink(project,subconf,substate,pool=pool)
+        else: sink = exutil.sink(project,subconf,substate)
+        next(sink) # advance to the first `yield`.
+        sinks[kind] = sink
+    data,count = [],0
+    for rows in chunks:
+        count += len(rows)
+        for sink in sinks.values(): sink.send(rows)
+        if collect: data += rows
+    if not count: print('no values to export.')
+    for kind,sink in sinks.items():
+        try:
+            sink.send(None)
+            raise Exception('export sink did not finish: ' + kind)
+        except StopIteration as stop: substate = stop.value
         if substate: state[kind] = substate
         else: state.pop(kind,None)
+    if collect and data:
+        state = export_data(project,{'export': collect},state,data,pool)
     return state
 
 # Generic 'utility' getter.
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import ctypes.util
+import ctypes
+import select
+import struct
+import time
+import os
+
+# utilities for watching directories for new files.  a watcher
+# is a simple dict which uses `inotify` (via `ctypes`) where it
+# is available, and falls back to periodically polling the
+# directory listings otherwise.  a directory counts as changed
+# once a file in it has been closed after writing or moved into
+# it; removals are ignored, since parsed files are moved away.
+
+# inotify event flags.
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = 0x800
+
+# events which indicate that a file is ready.
+READY = IN_CLOSE_WRITE | IN_MOVED_TO
+
+# events which indicate that a file is still being written.
+BUSY = IN_MODIFY | IN_CREATE
+
+# header of an inotify event: wd, mask, cookie, len.
+EVENT = struct.Struct('iIII')
+
+
+# generate a new watcher for `dirs`.  `interval` is the
+# number of seconds between polls when polling is used.
+def new_watcher(dirs,interval=1,poll=False):
+    for d in dirs:
+        if not os.path.isdir(d):
+            raise Exception('cannot watch missing directory: ' + d)
+    watcher = {'dirs': list(dirs), 'interval': interval}
+    fd = None if poll else inotify_init(dirs)
+    if fd is None:
+        watcher['snap'] = {d: snapshot(d) for d in dirs}
+    else: watcher['fd'],watcher['wds'] = fd
+    return watcher
+
+
+# block until at least one directory has changed (or `timeout`
+# seconds have passed), returning the set of changed directories.
+def wait_changes(watcher,timeout=None):
+    stop = time.time() + timeout if timeout is not None else None
+    while True:
+        left = None if stop is None else max(stop - time.time(),0)
+        ready,busy = next_events(watcher,left)
+        if ready: return ready
+        if stop is not None and time.time() >= stop: return set()
+
+
+# block until no directory activity has been seen for `quiet`
+# seconds, returning the set of directories which changed.
+# this lets files which are still being written settle.
+def wait_quiet(watcher,quiet):
+    changed = set()
+    while True:
+        ready,busy = next_events(watcher,quiet)
+        changed |= ready
+        if not (ready or busy): return changed
+
+
+# release any resources held by the watcher.
+def close_watcher(watcher):
+    if 'fd' in watcher:
+        os.close(watcher.pop('fd'))
+
+
+# get the next batch of activity, waiting up to `timeout` seconds.
+# returns the sets of directories with ready & busy files.
+def next_events(watcher,timeout):
+    if 'fd' in watcher:
+        return read_events(watcher,timeout)
+    wait = watcher['interval'] if timeout is None else min(timeout,watcher['interval'])
+    time.sleep(wait)
+    ready = set()
+    for d in watcher['dirs']:
+        snap = snapshot(d)
+        prev = watcher['snap'][d]
+        if any(prev.get(f) != s for f,s in snap.items()):
+            ready.add(d)
+        watcher['snap'][d] = snap
+    # polling can't tell a finished file from a busy one, so all
+    # changes count as both; `wait_quiet` waits until they stop.
+    return ready,set(ready)
+
+
+# read pending inotify events, waiting up to `timeout` seconds.
+def read_events(watcher,timeout):
+    fd,wds = watcher['fd'],watcher['wds']
+    ready,busy = set(),set()
+    if not select.select([fd],[],[],timeout)[0]:
+        return ready,busy
+    try: raw = os.read(fd,65536)
+    except BlockingIOError: return ready,busy
+    pos = 0
+    while pos < len(raw):
+        wd,mask,cookie,size = EVENT.unpack_from(raw,pos)
+        pos += EVENT.size + size
+        if not wd in wds: continue
+        if mask & READY: ready.add(wds[wd])
+        if mask & BUSY: busy.add(wds[wd])
+    return ready,busy
+
+
+# map a directory to the size & mtime of its files.
+def snapshot(directory):
+    snap = {}
+    for entry in os.scandir(directory):
+        if not entry.is_file(): continue
+        try: st = entry.stat()
+        except FileNotFoundError: continue
+        snap[entry.name] = (st.st_size,st.st_mtime_ns)
+    return snap
+
+
+# set up inotify watches for `dirs`.  returns a tuple of the
+# form `(fd,{wd: dir})`, or `None` if inotify is unavailable.
+def inotify_init(dirs):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'),use_errno=True)
+        init,add = libc.inotify_init1,libc.inotify_add_watch
+    except (OSError,AttributeError): return None
+    fd = init(IN_NONBLOCK)
+    if fd < 0: return None
+    wds = {}
+    for d in dirs:
+        wd = add(fd,os.fsencode(d),READY | BUSY)
+        if wd < 0:
+            os.close(fd)
+            return None
+        wds[wd] = d
+    return fd,wds
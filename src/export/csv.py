@@ -19,6 +19,22 @@ def export(project,config,state,data):
     return state
 
 
+# streaming form of `export`; a coroutine which is sent chunks of
+# rows, followed by `None`, at which point it returns the new state.
+# all chunks are written to the same file.
+def sink(project,config,state):
+    settings = config.get('settings',{})
+    filepath = None
+    rows = yield
+    while rows is not None:
+        if rows and filepath is None:
+            filepath = setup(project,settings)
+            fu.save_csv(filepath,rows)
+        elif rows: fu.save_csv(filepath,rows,append=True)
+        rows = yield
+    return state
+
+
 # load destination directory, generating it if needed.
 # generate file name based on `file-spec`.
 # return full path to file to target file.
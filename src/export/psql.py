@@ -1,29 +1,106 @@
 #!/usr/bin/env python3
 from src.core.error_utils import errdata,mklog
+import src.core.pool_utils as pu
+import src.core.index_utils as iu
 import psycopg2 as psql
 import time
+import io
 
+# collection of all possible insertion strings.
+INSERTS = {
+    'default' : '%s',
+    'to-timestamp' : 'to_timestamp(%s)',
+}
 
-# Main push-to-psql entry point
-def export(project,config,state,data):
+# name of the temporary table used by the `copy` push-mode.
+STAGE = 'scrape_stage'
+
+# connection settings which may be supplied alongside `database`.
+CONNECT = ['host','port','user','password']
+
+# flags that the runtime should supply a connection pool.
+POOLED = True
+
+
+# Main push-to-psql entry point.  If no `pool` is supplied
+# by the runtime, a temporary one is used for this export.
+def export(project,config,state,data,pool=None):
+    if pool is None:
+        pool = pu.new_pool()
+        try: return export(project,config,state,data,pool=pool)
+        finally: pu.close_pool(pool)
+    dedup = load_dedup(config['settings'],state)
+    push_data(project,config,data,pool,dedup)
+    return save_dedup(state,dedup)
+
+# streaming form of `export`; a coroutine which is sent chunks of
+# rows, followed by `None`, at which point it returns the new state.
+# each chunk is pushed as it arrives, but `primary-key` is enforced
+# across all chunks, and the dedup index is loaded once, checked
+# against each chunk, and only updated & saved once all chunks have
+# been pushed, exactly as if the rows had been exported together.
+def sink(project,config,state,pool=None):
+    if pool is None:
+        pool = pu.new_pool()
+        try: return (yield from sink(project,config,state,pool=pool))
+        finally: pu.close_pool(pool)
+    dedup = load_dedup(config['settings'],state)
+    keys = {} # primary keys of all rows pushed so far.
+    rows = yield
+    while rows is not None:
+        if rows: push_data(project,config,rows,pool,dedup,keys)
+        rows = yield
+    return save_dedup(state,dedup)
+
+# push a set of rows to psql.  if `dedup` is supplied (see
+# `load_dedup`), rows already in its index are skipped, and the
+# hashes of all rows which reached the database are added to it.
+# `keys` is the collection of primary keys already pushed, which
+# is updated in place (see `enforce_key`).
+def push_data(project,config,data,pool,dedup=None,keys=None):
     settings = config['settings']
-    db  = settings['database']
+    db  = connector(pool,settings)
     tbl = settings['table']
     fields = data[0]._fields
     duplicates = []
     primarykey = settings.get('primary-key',None)
     if primarykey:
-        data,dups = enforce_key(data,primarykey)
+        data,dups = enforce_key(data,primarykey,keys)
         duplicates += dups
+    # optionally drop rows which were already delivered by a previous run.
+    if dedup is not None:
+        mkhash = iu.hash_generator(fields,primarykey)
+        data,skipped = iu.filter_rows(dedup['index'],data,mkhash)
+        print('rows skipped via dedup index: ',len(skipped))
+    conversions = config.get('conversions',{})
     # handle custom-inserion instance if needed.
     if 'conversions' in config:
-        ins = custom_insertion(fields,config['conversions'])
+        ins = custom_insertion(fields,conversions)
     # default is just standard psycopg2 formatting...
     else: ins = ','.join(['%s'] * len(fields))
     cmd = 'INSERT INTO {} VALUES ({}) ON CONFLICT DO NOTHING'.format(tbl,ins)
+    # `row` pushes rows one at a time, `batch` pushes multi-row
+    # inserts, and `copy` bulk-loads rows via a staging table.
+    mode = settings.get('push-mode','row')
     print('pushing {} rows to psql...'.format(len(data)))
-    errors,errtxt,dups = handle_push(data,cmd,db)
+    if mode == 'row':
+        errors,errtxt,dups = handle_push(data,cmd,db)
+    elif mode == 'batch':
+        size = settings.get('batch-size',1000)
+        errors,errtxt,dups = handle_batch(data,tbl,ins,db,size)
+    elif mode == 'copy':
+        size = settings.get('copy-size',10000)
+        fallback = settings.get('batch-size',1000)
+        errors,errtxt,dups = handle_copy(data,tbl,ins,db,conversions,size,fallback)
+    else: raise Exception('unrecognized push-mode: {}'.format(mode))
     duplicates += dups
+    # add all rows which reached the database to the index.  rows which
+    # were skipped are added again, so that a row only expires from the
+    # index once it has stopped being seen for `expire` seconds.
+    if dedup is not None:
+        failed = set(map(mkhash,errors))
+        pushed = [h for h in map(mkhash,data) if not h in failed]
+        dedup['hashes'] += pushed + list(map(mkhash,skipped))
     if duplicates:
         print('duplicate rows ignored: ',len(duplicates))
     # save any rows which raised unexpexted errors
@@ -37,8 +114,35 @@ def export(project,config,state,data):
     # append any unexpected errors to
     # the project's main error log.
     for err in errtxt: mklog(project,err)
+
+# load the index of previously delivered rows, if enabled by
+# `dedup-index`, which may be `true` or an expiry time in seconds.
+# returns `None` if the index is not enabled.  hashes of newly
+# delivered rows are collected under `hashes` (see `save_dedup`).
+def load_dedup(settings,state):
+    dedup = settings.get('dedup-index',False)
+    if not dedup: return None
+    expire = iu.EXPIRE if isinstance(dedup,bool) else dedup
+    index = iu.load_index(state.get('dedup-index'))
+    return {'index': index, 'expire': expire, 'hashes': []}
+
+# add the collected hashes to the index & save it to `state`.
+def save_dedup(state,dedup):
+    if dedup is None: return state
+    index = iu.update_index(dedup['index'],dedup['hashes'],dedup['expire'])
+    state['dedup-index'] = iu.dump_index(index)
     return state
 
+# Generate a callable which checks a connection out of `pool`
+# for use in a `with` block.  Connections are pooled under the
+# full set of connection settings.
+def connector(pool,settings):
+    params = {'database': settings['database']}
+    params.update({k: settings[k] for k in CONNECT if k in settings})
+    key = tuple(sorted(params.items()))
+    connect = lambda: psql.connect(**params)
+    return lambda: pu.connection(pool,key,connect)
+
 # Controller for the actual push attempt.
 # Forces all rows to be attempted at least once.
 # This is a workaround for the fact that psql,
@@ -66,7 +170,10 @@ def handle_push(data,cmd,db):
 def push_rows(data,cmd,db):
     ignored,uploaded = [],[]
     error,text = None,None
-    with psql.connect(database=db) as con:
+    # the connection itself is deliberately not used as a context
+    # manager; doing so opens a transaction even in autocommit mode,
+    # which rolls back every row pushed prior to an exception.
+    with db() as con:
         con.set_session(autocommit=True)
         for i in range(len(data)):
             row = data.pop(0)
@@ -81,39 +188,184 @@ def push_rows(data,cmd,db):
                     error = row
                     text = str(err)
                 break
-    con.close()
     return data,uploaded,ignored,error,text
 
 
+# Batched alternative to `handle_push`.  Rows are pushed as
+# multi-row inserts of up to `size` rows.  A batch which raises
+# an exception is split in half & each half is retried, until
+# the offending rows have been isolated one at a time.
+def handle_batch(data,tbl,ins,db,size=1000):
+    rowtotal = len(data)
+    uploaded,ignored = [],[]
+    errors,errtxt = [],[]
+    with db() as con:
+        con.set_session(autocommit=True)
+        for i in range(0,rowtotal,size):
+            upld,igns,errs,txts = push_batch(con,data[i:i+size],tbl,ins)
+            uploaded += upld
+            ignored += igns
+            errors += errs
+            errtxt += txts
+    assert rowtotal == sum((len(errors),len(ignored),len(uploaded)))
+    return errors,errtxt,ignored
+
+# Attempts to push a batch of rows as a single statement.
+# Recursively bisects the batch upon failure.  Returns the
+# uploaded, ignored & erroneous rows, and any error text.
+def push_batch(con,rows,tbl,ins):
+    try:
+        with con.cursor() as cur:
+            # values are formatted client-side, so building
+            # the statement costs no round trips.
+            mkval = lambda r: cur.mogrify('({})'.format(ins),r).decode()
+            values = ','.join(mkval(r) for r in rows)
+            cmd = 'INSERT INTO {} VALUES {} ON CONFLICT DO NOTHING'
+            cur.execute(cmd.format(tbl,values))
+        return rows,[],[],[]
+    except Exception as err:
+        if len(rows) == 1:
+            if 'duplicate key' in str(err):
+                return [],rows,[],[]
+            else: return [],[],rows,[str(err)]
+    mid = len(rows) // 2
+    head = push_batch(con,rows[:mid],tbl,ins)
+    tail = push_batch(con,rows[mid:],tbl,ins)
+    return tuple(h + t for h,t in zip(head,tail))
+
+
+# Bulk alternative to `handle_push`.  Rows are streamed in chunks
+# into a temporary staging table via `COPY`, and then merged into
+# `tbl` by a single `INSERT ... ON CONFLICT DO NOTHING`.  Chunks which
+# raise an unexpected error are handed off to `handle_batch`, so that
+# the offending rows are still isolated & reported individually, in
+# batches of `fallback` rows.
+def handle_copy(data,tbl,ins,db,insmap,size=10000,fallback=1000):
+    rowtotal = len(data)
+    uploaded,ignored = 0,[]
+    errors,errtxt = [],[]
+    for i in range(0,rowtotal,size):
+        chunk = data[i:i+size]
+        try:
+            errs,txts,dups = [],[],copy_rows(chunk,db,tbl,insmap)
+        except Exception as err:
+            print('bulk copy failed, isolating bad rows: ' + str(err))
+            errs,txts,dups = handle_batch(chunk,tbl,ins,db,fallback)
+        uploaded += len(chunk) - len(errs) - len(dups)
+        errors += errs
+        errtxt += txts
+        ignored += dups
+    assert rowtotal == sum((len(errors),len(ignored),uploaded))
+    return errors,errtxt,ignored
+
+# Load a single chunk of rows via the staging table.  Runs as one
+# transaction, returning the rows which were not inserted due to
+# a conflict with rows already present in `tbl`.
+def copy_rows(rows,db,tbl,insmap):
+    fields = rows[0]._fields
+    with db() as con:
+        con.set_session(autocommit=False)
+        with con:
+            with con.cursor() as cur:
+                columns = target_columns(cur,tbl,fields,insmap)
+                cols = ','.join(columns)
+                # the staging table mirrors the column types of `tbl`,
+                # except where values are converted during the merge.
+                cur.execute('CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA'
+                    .format(STAGE,cols,tbl))
+                for f,c in zip(fields,columns):
+                    if insmap.get(f,'default') == 'default': continue
+                    cur.execute('ALTER TABLE {} ALTER COLUMN {} TYPE double precision USING NULL'
+                        .format(STAGE,c))
+                cur.execute('ALTER TABLE {} ADD COLUMN scrape_idx bigint'.format(STAGE))
+                cmd = 'COPY {} ({},scrape_idx) FROM STDIN'.format(STAGE,cols)
+                cur.copy_expert(cmd,copy_buffer(rows))
+                # apply `conversions` to staged columns; `%` is
+                # replaced directly, as no parameters are passed.
+                conv = lambda f,c: INSERTS[insmap.get(f,'default')].replace('%s',c)
+                exprs = [conv(f,c) for f,c in zip(fields,columns)]
+                # rows are matched on every column (treating NULLs as
+                # equal) & on their rank among identical rows, so that
+                # repeats of an inserted row within the chunk are
+                # reported as well.
+                match = ' AND '.join('i.{0} IS NOT DISTINCT FROM s.{0}'.format(c)
+                    for c in columns)
+                staged = ','.join('{} AS {}'.format(e,c) for e,c in zip(exprs,columns))
+                # merge into `tbl`, selecting the staged index of every
+                # row which did not make it into the set of inserted rows.
+                cur.execute('''WITH ins AS (INSERT INTO {tbl} ({cols})
+                    SELECT {exprs} FROM {stage} ORDER BY scrape_idx
+                    ON CONFLICT DO NOTHING RETURNING {cols}),
+                    i AS (SELECT {cols},row_number() OVER
+                        (PARTITION BY {cols}) AS scrape_n FROM ins),
+                    s AS (SELECT scrape_idx,{staged},row_number() OVER
+                        (PARTITION BY {exprs} ORDER BY scrape_idx) AS scrape_n FROM {stage})
+                    SELECT s.scrape_idx FROM s WHERE NOT EXISTS
+                    (SELECT 1 FROM i WHERE i.scrape_n = s.scrape_n AND {match})
+                    ORDER BY s.scrape_idx'''
+                    .format(tbl=tbl,cols=cols,exprs=','.join(exprs),
+                        staged=staged,stage=STAGE,match=match))
+                dups = [rows[i] for (i,) in cur.fetchall()]
+    return dups
+
+# Get the (quoted) names of the columns in `tbl` which
+# receive the values of `fields`, skipping any positions
+# which are filled by `psql-defaults`.
+def target_columns(cur,tbl,fields,insmap):
+    insmap,psql_defaults = split_defaults(insmap)
+    cur.execute('SELECT * FROM {} LIMIT 0'.format(tbl))
+    names = [d[0] for d in cur.description]
+    slots = list(fields)
+    for idx in psql_defaults:
+        slots.insert(int(idx),None)
+    if len(slots) > len(names):
+        raise Exception('more insertion values than columns in: ' + tbl)
+    quote = lambda n: '"{}"'.format(n.replace('"','""'))
+    return [quote(n) for n,s in zip(names,slots) if s is not None]
+
+# Write rows to an in-memory file in the text format
+# expected by `COPY`, tagging each with its index.
+def copy_buffer(rows):
+    escape = lambda s: s.replace('\\','\\\\').replace('\t','\\t') \
+        .replace('\n','\\n').replace('\r','\\r')
+    fmt = lambda v: '\\N' if v is None else escape(str(v))
+    buf = io.StringIO()
+    for i,row in enumerate(rows):
+        buf.write('\t'.join([*map(fmt,row),str(i)]) + '\n')
+    buf.seek(0)
+    return buf
+
+
 # Generate a custom insertion string.
 def custom_insertion(fields,insmap):
-    # collection of all possible insertion strings.
-    inserts = {
-        'default' : '%s',
-        'to-timestamp' : 'to_timestamp(%s)',
-    }
-    if 'psql-defaults' in insmap:
-        psql_defaults = insmap.pop('psql-defaults')
-    else: psql_defaults = []
+    insmap,psql_defaults = split_defaults(insmap)
     for i in insmap:
         if i not in fields:
             raise Exception('unrecognized data field: {}'.format(i))
-        if insmap[i] not in inserts:
+        if insmap[i] not in INSERTS:
             raise Exception('unrecognized insertion type: {}'.format(insmap[i]))
     ins = []
     # build the custom insertion string field by field.
     for f in fields:
         if f in insmap:
-            ins.append(inserts[insmap[f]])
-        else: ins.append(inserts['default'])
+            ins.append(INSERTS[insmap[f]])
+        else: ins.append(INSERTS['default'])
     if psql_defaults:
         for idx in psql_defaults:
             ins.insert(int(idx),'DEFAULT')
     return ','.join(ins)
 
+# Separate the `psql-defaults` list from a conversion
+# mapping without modifying the original config.
+def split_defaults(insmap):
+    insmap = {k:v for k,v in insmap.items()}
+    psql_defaults = insmap.pop('psql-defaults',[])
+    return insmap,psql_defaults
+
 
-# enforce a primary key.
-def enforce_key(data,key):
+# enforce a primary key.  `seen` may be supplied to
+# carry the keys of previously pushed rows between calls.
+def enforce_key(data,key,seen=None):
     fields = list(data[0]._fields)
     indexes = []
     for field in key:
@@ -121,7 +373,8 @@ def enforce_key(data,key):
             raise Exception('unknown primary key field: ' + field)
         indexes.append(fields.index(field))
     mkkey = lambda row: str(tuple((row[i] for i in indexes)))
-    seen,unique,dups = {},[],[]
+    seen = {} if seen is None else seen
+    unique,dups = [],[]
     for row in data:
         pk = mkkey(row)
         if not pk in seen:
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+from src.core.error_utils import error_template
+import src.core.data_utils as du
+from operator import attrgetter,itemgetter,mod,sub
+from itertools import groupby,repeat
+import time
+
+# Determines order of application
+# during multi-phase reshaping process.
+ORD = 1
+
+# accepts a shared uid index (see `du.index_rows`).
+INDEXED = True
+
+downsample_error = error_template('`downsample` based data-reshaping step')
+
+# summaries of a bucket are lists of floats of the form
+# `[count,sum,min,max,last-time,last-value]`.
+methods = {
+    'mean': lambda s: s[1] / s[0],
+    'min': itemgetter(2),
+    'max': itemgetter(3),
+    'last': itemgetter(5),
+    'sum': itemgetter(1),
+    'count': itemgetter(0)
+    }
+
+gettime = attrgetter('timestamp')
+getvalue = attrgetter('value')
+
+# default age (in seconds, relative to the current time) at
+# which a still-open bucket is closed regardless (one day).
+EXPIRE = 86400
+
+
+# reshape : proj -> conf -> state -> data -> (state,data)
+# rows are aggregated per uid into buckets of `width` seconds, each
+# bucket being replaced by a single row at its start time.  the latest
+# bucket of each uid may still receive rows, so it is always held open
+# in `state`, and only closed once a row for a later bucket arrives
+# (i.e.; in data time, so that historical data is aggregated just as
+# live data is).  uids which receive no rows at all are flushed once
+# their open bucket is older than `expire` seconds (in wall-clock time).
+# the latest bucket emitted for each uid is also kept in `state`, and
+# rows which arrive late, i.e.; for a bucket at or before that one, are
+# dropped (with a count printed), so that no bucket is ever emitted
+# twice.  rows with non-numeric values are passed through unchanged.
+def reshape(project,config,state,data,index=None):
+    width,getval,expire = get_settings(config)
+    groups = index['groups'] if index else du.index_rows(data)['groups']
+    state,regroup = aggregate(state,groups,width,getval)
+    state,flushed = flush(state,width,getval,expire,groups)
+    regroup.update(flushed)
+    rows = [row for group in regroup.values() for row in group]
+    if index is not None:
+        index['groups'],index['ordered'] = regroup,True
+    return state,rows
+
+
+# open buckets are carried in `state` between chunks just as between
+# runs, and quiet uids are only flushed once all chunks have been seen,
+# so rows can always be downsampled a chunk at a time.
+def streamable(config): return True
+
+# streaming form of `reshape`; runs over each chunk in turn,
+# yielding the downsampled chunks & returning the new state.
+def stream(project,config,state,chunks):
+    width,getval,expire = get_settings(config)
+    seen = set()
+    for rows in chunks:
+        groups = du.index_rows(rows)['groups']
+        seen.update(groups)
+        state,regroup = aggregate(state,groups,width,getval)
+        rows = [row for group in regroup.values() for row in group]
+        if rows: yield rows
+    state,flushed = flush(state,width,getval,expire,seen)
+    rows = [row for group in flushed.values() for row in group]
+    if rows: yield rows
+    return state
+
+
+# check the settings of `config`, returning the bucket
+# width, the summary getter & the expiry time.
+def get_settings(config):
+    mkerr = downsample_error('aggregating rows into time buckets')
+    settings = config.get('settings',{})
+    width = settings.get('width')
+    if not isinstance(width,(int,float)) or isinstance(width,bool) or width <= 0:
+        raise Exception(mkerr('`width` must be a positive number of seconds'))
+    method = settings.get('method','mean')
+    if not method in methods:
+        raise Exception(mkerr('unrecognized method: ' + str(method)))
+    return width,methods[method],settings.get('expire',EXPIRE)
+
+
+# aggregate the rows of each uid in `groups` into buckets, merging
+# them with the open buckets in `state`.  returns the new state and
+# the output rows, grouped by uid.
+def aggregate(state,groups,width,getval):
+    opened = state.get('open',{})
+    closed = state.get('closed',{})
+    regroup,late = {},0
+    for uid,rows in groups.items():
+        passed,buckets = split_buckets(rows,width)
+        if uid in closed:
+            for bucket in [b for b in buckets if b <= closed[uid]]:
+                late += int(buckets.pop(bucket)[0])
+        template = rows[0]
+        if uid in opened:
+            last = opened[uid]
+            bucket = last['time']
+            if bucket in buckets:
+                buckets[bucket] = merge(last['summary'],buckets[bucket])
+            else: buckets[bucket] = last['summary']
+        out = passed
+        if buckets:
+            current = max(buckets)
+            opened[uid] = {
+                'row': [template.node,template.name,template.unit],
+                'time': current,
+                'summary': buckets.pop(current)
+                }
+            mkrow = lambda b,s: template._replace(timestamp=float(b),value=getval(s))
+            out = out + [mkrow(b,buckets[b]) for b in sorted(buckets)]
+            if buckets: closed[uid] = max(buckets)
+        if out: regroup[uid] = out
+    if late: print('late rows dropped: ',late)
+    return set_buckets(state,opened,closed),regroup
+
+
+# close the open buckets of uids which are not in `active` & are
+# more than `expire` seconds old.  returns the new state and the
+# output rows, grouped by uid.
+def flush(state,width,getval,expire,active):
+    opened = state.get('open',{})
+    closed = state.get('closed',{})
+    oldest = time.time() - expire
+    regroup = {}
+    for uid,last in list(opened.items()):
+        if uid in active or last['time'] + width > oldest: continue
+        row = du.Row(*last['row'],float(last['time']),getval(last['summary']))
+        regroup[uid] = [row]
+        closed[uid] = last['time']
+        del opened[uid]
+    return set_buckets(state,opened,closed),regroup
+
+
+# set the open & closed buckets of `state`, dropping empty entries.
+def set_buckets(state,opened,closed):
+    if opened: state['open'] = opened
+    else: state.pop('open',None)
+    if closed: state['closed'] = closed
+    else: state.pop('closed',None)
+    return state
+
+
+# split the rows of a single uid into those with non-numeric
+# values, and summaries of the rows in each bucket.  rows are
+# taken in runs which fall into the same bucket, so time-ordered
+# rows are summarized a whole bucket at a time.
+def split_buckets(rows,width):
+    passed = []
+    vals = list(map(getvalue,rows))
+    if not set(map(type,vals)) <= {int,float}:
+        passed = [r for r,v in zip(rows,vals) if not type(v) in (int,float)]
+        rows = [r for r,v in zip(rows,vals) if type(v) in (int,float)]
+        vals = list(map(getvalue,rows))
+    times = list(map(gettime,rows))
+    keys = map(sub,times,map(mod,times,repeat(width)))
+    spans,pos = {},0
+    for bucket,run in groupby(keys):
+        stop = pos + len(list(run))
+        if bucket in spans: spans[bucket].append(slice(pos,stop))
+        else: spans[bucket] = [slice(pos,stop)]
+        pos = stop
+    buckets = {}
+    for bucket,parts in spans.items():
+        t = [x for p in parts for x in times[p]] if len(parts) > 1 else times[parts[0]]
+        v = [x for p in parts for x in vals[p]] if len(parts) > 1 else vals[parts[0]]
+        # ties in time are resolved in favor of the later row.
+        latest = max(t)
+        i = len(t) - 1 - t[::-1].index(latest)
+        key = int(bucket) if bucket == int(bucket) else bucket
+        summary = len(v),sum(v),min(v),max(v),latest,v[i]
+        buckets[key] = [float(x) for x in summary]
+    return passed,buckets
+
+
+# merge two bucket summaries, where `b` holds the later rows.
+def merge(a,b):
+    last = b[4:] if b[4] >= a[4] else a[4:]
+    return [a[0] + b[0],a[1] + b[1],min(a[2],b[2]),max(a[3],b[3]),*last]
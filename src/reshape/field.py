@@ -2,6 +2,9 @@
 from src.core.error_utils import error_template
 import src.core.data_utils as du
 from collections import namedtuple
+from itertools import repeat
+from operator import add,itemgetter
+from functools import partial
 import time
 
 # Defines order of
@@ -10,8 +13,36 @@ ORD = 2
 
 field_error = error_template('`field` based data-reshaping step')
 
-# primary entry point.
+# primary entry point.  the declared sub-steps are first planned
+# against the fields of the first row, and then compiled into a
+# single transformer, so that each row is only built once.
 def reshape(project,config,state,data):
+    order = get_order(config)
+    rows = [r for r in data]
+    if not rows: return state,rows
+    schema = plan_steps(project,config,order,rows[0]._fields)
+    transform = compile_schema(schema)
+    return state,transform(rows)
+
+# all sub-steps work row by row, so rows can always
+# be reshaped a chunk at a time (see `stream`).
+def streamable(config): return True
+
+# streaming form of `reshape`.  the transformer is compiled
+# once, from the first chunk, & reused for all later chunks.
+def stream(project,config,state,chunks):
+    order = get_order(config)
+    transform = None
+    for rows in chunks:
+        if not rows: continue
+        if transform is None:
+            schema = plan_steps(project,config,order,rows[0]._fields)
+            transform = compile_schema(schema)
+        yield transform(rows)
+    return state
+
+# check the declared sub-steps, returning the order to run them in.
+def get_order(config):
     mkerr = field_error('attempting to run declared sub-steps')
     settings = config.get('settings',{})
     default = ["modify","generate"]
@@ -21,31 +52,89 @@ def reshape(project,config,state,data):
             error = mkerr('unrecognized sub-step section: ' + step)
             raise Exception(error)
     order = settings.get('in-order',default)
-    rows = [r for r in data]
+    return [step for step in order if step in declared]
+
+# plan all sub-steps in `order` against rows with `fields`.
+def plan_steps(project,config,order,fields):
+    mkerr = field_error('attempting to run declared sub-steps')
+    schema = new_schema(fields)
     for step in order:
-        if not step in declared: continue
         if step == 'modify':
-            state,rows = run_modifications(project,config,state,rows)
+            schema = plan_modifications(project,config,schema)
         elif step == 'generate':
-            state,rows = run_generators(project,config,state,rows)
+            schema = plan_generators(project,config,schema)
         else:
             error = mkerr('unrecognized sub-step name: ' + step)
             raise Exception(error)
-    return state,rows
+    return schema
 
 # Map one or more fields to some other set of fields.
 def run_modifications(project,config,state,data):
+    if not data: return state,data
+    schema = new_schema(data[0]._fields)
+    schema = plan_modifications(project,config,schema)
+    return state,compile_schema(schema)(data)
+
+# run all specified `generate` steps.
+def run_generators(project,config,state,data):
+    if not data: return state,data
+    schema = new_schema(data[0]._fields)
+    schema = plan_generators(project,config,schema)
+    return state,compile_schema(schema)(data)
+
+# a schema describes the rows produced by a sequence of sub-steps.
+# `fields` are the output field names, `rowtype` the output row type
+# (or `None` if rows are left as-is), and `sources` says where each
+# output value comes from; either `('field',i,casts)`, the `i`th
+# input value passed through each of `casts`, or `('const',v,())`.
+def new_schema(fields):
+    sources = [('field',i,()) for i in range(len(fields))]
+    return {'fields': tuple(fields), 'sources': sources, 'rowtype': None}
+
+# compile a schema into a function which transforms a list of rows.
+# each row is extended with its cast values & the constants, and the
+# output values are then picked out by a single `itemgetter`, so rows
+# are built without any python-level work per row or per field.
+def compile_schema(schema):
+    if schema['rowtype'] is None: return lambda rows: rows
+    build = partial(tuple.__new__,schema['rowtype'])
+    sources = schema['sources']
+    casts = [(i,c) for kind,i,c in sources if kind == 'field' and c]
+    consts = tuple(v for kind,v,c in sources if kind == 'const')
+    # values are laid out as `(*cast values,*constants,*row)`.
+    offset,indexes = len(casts) + len(consts),[]
+    counts = {'cast': 0, 'const': len(casts)}
+    for kind,value,c in sources:
+        if kind == 'field' and not c: indexes.append(offset + value)
+        else:
+            key = 'const' if kind == 'const' else 'cast'
+            indexes.append(counts[key])
+            counts[key] += 1
+    if len(indexes) > 1: getter = itemgetter(*indexes)
+    elif indexes: getter = lambda r,i=indexes[0]: (r[i],)
+    else: getter = lambda r: ()
+    def transform(rows):
+        extended = map(add,repeat(consts),rows)
+        if casts:
+            columns = [map(itemgetter(i),rows) for i,_ in casts]
+            for n,(_,c) in enumerate(casts):
+                for cast in c: columns[n] = map(cast,columns[n])
+            extended = map(add,zip(*columns),extended)
+        return list(map(build,map(getter,extended)))
+    return transform
+
+# plan the mapping of one or more fields to some other set of fields.
+def plan_modifications(project,config,schema):
     # TODO: add an `on-modify` handler for options `discard` & `archive`
     fieldmap = config['modify']
     mkerr = field_error('field name & order reassignment')
-    if not data: return state,data
     fieldmap = { k.lower() : fieldmap[k] for k in fieldmap }
-    dfields  = data[0]._fields
+    dfields  = schema['fields']
     for field in fieldmap:
         if field not in dfields:
             error = mkerr('unrecognized field: ' + field)
             raise Exception(error)
-    types = {'int':int,'float':float,'str':str,'bool':bool,'none':lambda v:v}
+    types = {'int':int,'float':float,'str':str,'bool':bool,'none':None}
     indexmap = []
     namemap  = []
     typemap  = []
@@ -66,71 +155,53 @@ def run_modifications(project,config,state,data):
     namemap  = foi(sorted(namemap,key=sbi))
     typemap  = foi(sorted(typemap,key=sbi))
     fmtrow   = namedtuple('fmtrow', namemap)
-    fmtdata  = []
-    for d in data:
-        row = []
-        for i in indexmap:
-            row.append(d[i])
-        for i,t in enumerate(typemap):
-            row[i] = types[t](row[i])
-        fmtdata.append(fmtrow(*row))
-    return state,fmtdata
+    sources  = []
+    for i,t in zip(indexmap,typemap):
+        kind,value,casts = schema['sources'][i]
+        cast = types[t]
+        if cast is None: pass
+        elif kind == 'const': value = cast(value)
+        else: casts = casts + (cast,)
+        sources.append((kind,value,casts))
+    return {'fields': fmtrow._fields, 'sources': sources, 'rowtype': fmtrow}
 
-
-# run all specified `generate` steps.
-def run_generators(project,config,state,data):
-    if not data: return state,data
+# plan all specified `generate` steps.
+def plan_generators(project,config,schema):
     generators = config['generate']
     settings = config.get('settings',{})
     mkerr = field_error('generating new fields')
-    rows = [r for r in data]
     for gen in generators:
         value = gen['value']
         if value == 'current-time':
-            state,rows = generate_current_time(project,gen,state,rows)
+            schema = plan_current_time(project,gen,schema)
         elif value == 'literal':
-            state,rows = generate_literal(project,gen,state,rows)
+            schema = plan_literal(project,gen,schema)
         else:
             error = mkerr('unrecognized `value` argument: ' + value)
             raise Exception(error)
-    return state,rows
+    return schema
 
 # add a field with some arbitrary value for all rows.
-def generate_literal(project,config,state,rows):
-    if not rows: return
+def plan_literal(project,config,schema):
     mkerr = field_error('generating field: `literal`')
     title = config['title']
     index = config.get('index','append')
     value = config['ident']
-    if isinstance(index,str):
-        if index == "append":
-            fmt = lambda v,r: list(r) + [v]
-        else:
-            error = mkerr('unexpected value for `index`: ' + index)
-            raise Exception(error)
-    elif isinstance(index,int):
-        fmt = lambda v,r: list((*r[0:index],v,*r[index:]))
-    else:
-        error = mkerr('unexpected value for `index`: ' + str(index))
-        raise Exception(error)
-    fields = rows[0]._fields
-    newfields = fmt(title,fields)
-    mkrow = du.custom_row_generator(newfields)
-    modify = lambda r: mkrow(fmt(value,r))
-    newrows = []
-    for row in rows:
-        newrow = modify(row)
-        newrows.append(newrow)
-    return state,newrows
+    fmt = get_formatter(mkerr,index)
+    return insert_const(schema,fmt,title,value)
 
 # add a generated field containing the current time.
-def generate_current_time(project,config,state,rows):
-    if not rows: return
+def plan_current_time(project,config,schema):
     mkerr = field_error('generating field: `current-time`')
     title = config['title']
     index = config.get('index',"append")
     dec = config.get('round',6)
     now = round(time.time(),dec) if dec > 0 else int(time.time())
+    fmt = get_formatter(mkerr,index)
+    return insert_const(schema,fmt,title,now)
+
+# get a function which inserts a value into a list at `index`.
+def get_formatter(mkerr,index):
     if isinstance(index,str):
         if index == "append":
             fmt = lambda v,r: list(r) + [v]
@@ -142,13 +213,11 @@ def generate_current_time(project,config,state,rows):
     else:
         error = mkerr('unexpected value for `index`: ' + str(index))
         raise Exception(error)
-    fields = rows[0]._fields
-    newfields = fmt(title,fields)
-    mkrow = du.custom_row_generator(newfields)
-    modify = lambda r: mkrow(fmt(now,r))
-    newrows = []
-    for row in rows:
-        newrow = modify(row)
-        newrows.append(newrow)
-    return state,newrows
+    return fmt
 
+# insert a field with a constant value into a schema.
+def insert_const(schema,fmt,title,value):
+    newfields = fmt(title,schema['fields'])
+    row = namedtuple('row',newfields)
+    sources = fmt(('const',value,()),schema['sources'])
+    return {'fields': row._fields, 'sources': sources, 'rowtype': row}
@@ -1,39 +1,71 @@
 #!/usr/bin/env python3
 from src.core.error_utils import errdata, error_template
+import src.core.partial_utils as pu
 import src.core.data_utils as du
 import src.core.file_utils as fu
+from itertools import compress,repeat
+from operator import itemgetter
+
+# numpy is optional; if available, numeric limiting
+# filters are evaluated as a single vectorized mask.
+try: import numpy as np
+except ImportError: np = None
 
 # Determines order of application
 # during mulit-phase reshaping process.
 ORD = 0
 
+# accepts a shared uid index (see `du.index_rows`).
+INDEXED = True
+
 reshape_error = error_template('`value` based data-reshaping step')
 
 
 # reshape : proj -> conf -> state -> data -> (state,data)
-def reshape(project,config,state,data):
+# if supplied, `index` is kept in sync with the data by all actions.
+def reshape(project,config,state,data,index=None):
     settings = config['settings']
     actions = ['filter','generate','replace']
     if 'in-order' in settings:
         order = settings['in-order']
     else: order = [a for a in actions if a in config]
+    # the shared index is grouped by the default uid; if a custom
+    # key is in use, it is marked as stale for the runtime instead.
+    if index is not None and settings.get('uid-key'):
+        index['groups'] = None
+        index = None
     errors = []
     for action in order:
         substate = state[action] if action in state else {}
         if action == 'filter':
-            substate,data = run_filters(project,config,substate,data)
+            substate,data = run_filters(project,config,substate,data,index)
         elif action == 'generate':
-            substate,data = run_generators(project,config,substate,data)
+            substate,data = run_generators(project,config,substate,data,index)
         elif action == 'replace':
-            substate,data = run_replacements(project,config,substate,data)
+            substate,data = run_replacements(project,config,substate,data,index)
         else: raise Exception('unknown action: ' + action)
         if substate: state[action] = substate
         else: state.pop(action,None)
     return state,data
 
+# the `filter` & `replace` actions work row by row, so they can be
+# run a chunk at a time (see `stream`); `generate` needs all rows.
+def streamable(config):
+    settings = config.get('settings',{})
+    order = settings.get('in-order',[a for a in config if a != 'settings'])
+    return not 'generate' in order
+
+# streaming form of `reshape`; runs over each chunk in turn,
+# yielding the reshaped chunks & returning the new state.
+def stream(project,config,state,chunks):
+    for rows in chunks:
+        state,rows = reshape(project,config,state,rows)
+        if rows: yield rows
+    return state
+
 # Filter out undesired data-points, either
 # by name of data-point, or by value range.
-def run_filters(project,config,state,data):
+def run_filters(project,config,state,data,index=None):
     if not data: return state,data
     settings = config['settings']
     filters = config['filter']
@@ -46,7 +78,7 @@ def run_filters(project,config,state,data):
     fields = {k: v for k,v in filters.items() if
             isinstance(v,dict) and k in data[0]._fields}
     # dictionary of all rows sorted by their uid.
-    uidsort = sort_by_uid(settings,data)
+    uidsort = index['groups'] if index else sort_by_uid(settings,data)
     # collectors for rows based on removal
     keep,remove = [],[]
     # run binary filters, removing all uids
@@ -71,6 +103,12 @@ def run_filters(project,config,state,data):
     for field,spec in fields.items():
         keep,rem = limiting_filters(spec,keep,target=field)
         remove += rem
+        # regroup the (already ordered) survivors if any
+        # were removed, or if their values were rounded.
+        if (rem or 'dec' in spec) and index:
+            index['groups'] = sort_by_uid(settings,keep)
+    # the remaining data is now exactly the concatenation of its groups.
+    if index: index['ordered'] = True
     # TEST: ensure that no filters are causing silent removals.
     assert len(data) == (len(keep) + len(remove))
     # deal with removed rows as specified in config.
@@ -79,19 +117,22 @@ def run_filters(project,config,state,data):
 
 
 def limiting_filters(spec,rows,target='value'):
-    if not rows: return
+    if not rows: return rows,[]
     keep,remove = rows,[]
+    # try the vectorized path for numeric filters first.
+    masked = mask_filters(spec,rows,target)
+    if masked: keep,remove = masked
     # filter out trailing decimal places in `target`.
-    if 'dec' in spec:
+    if 'dec' in spec and not masked:
         fltr = lambda r: round(float(r),spec['dec'])
         keep = du.map_rows(fltr,target,keep)
     # filter out rows with too large of a value in `target`.
-    if 'max' in spec:
+    if 'max' in spec and not masked:
         fltr = lambda v: v <= spec['max']
         keep,rem = du.split_rows(fltr,keep,target=target)
         remove += rem
     # filter out rows with too small a value in `target`.
-    if 'min' in spec:
+    if 'min' in spec and not masked:
         fltr = lambda v: v >= spec['min']
         keep,rem = du.split_rows(fltr,keep,target=target)
         remove += rem
@@ -99,7 +140,7 @@ def limiting_filters(spec,rows,target='value'):
     # multiple of some value.  Called 'mod' because it is
     # filtering out values which do not have a clean modulus
     # for the given value... this may need renaming.
-    if 'mod' in spec:
+    if 'mod' in spec and not masked:
         fltr = lambda v: int(v) % spec['mod'] == 0
         keep,rem = du.split_rows(fltr,keep,target=target)
         remove += rem
@@ -124,45 +165,97 @@ def limiting_filters(spec,rows,target='value'):
     return keep,remove
 
 
+# vectorized form of the `dec`, `max`, `min` & `mod` filters, which
+# evaluates them as one boolean mask over the values of `target`.
+# rows are removed in the same order as by the individual filters.
+# returns `None` if numpy is unavailable, there are no numeric
+# filters, or the values aren't plain numbers (in which case the
+# per-row filters are used, & raise any errors as usual).
+def mask_filters(spec,rows,target):
+    stages = [k for k in ('max','min','mod') if k in spec]
+    if np is None or not stages: return None
+    number = lambda v: type(v) in (int,float)
+    if not all(number(spec[k]) for k in stages): return None
+    if 'mod' in spec and spec['mod'] == 0: return None
+    index = rows[0]._fields.index(target)
+    values = list(map(itemgetter(index),rows))
+    if 'dec' in spec:
+        values = list(map(round,map(float,values),repeat(spec['dec'])))
+        rows = du.replace_column(target,values,rows)
+    else:
+        types = set(map(type,values))
+        if not types <= {int,float}: return None
+        # large ints can't be represented exactly as floats.
+        if int in types and any(type(v) is int and abs(v) > 2**53 for v in values):
+            return None
+    values = np.array(values,dtype=float)
+    alive = np.ones(len(values),dtype=bool)
+    failed = []
+    for stage in stages:
+        if stage == 'max': passed = values <= spec['max']
+        elif stage == 'min': passed = values >= spec['min']
+        else:
+            # `int` fails on non-finite values; let the per-row filter raise.
+            if not np.isfinite(values[alive]).all(): return None
+            with np.errstate(invalid='ignore'):
+                passed = np.mod(np.trunc(values),spec['mod']) == 0
+        failed.append(alive & ~passed)
+        alive &= passed
+    keep = list(compress(rows,alive.tolist()))
+    remove = [r for mask in failed for r in compress(rows,mask.tolist())]
+    return keep,remove
+
+
 
 
 # Generate one or more new sets of data-points
 # by adding and subtracting `value` fields.
-def run_generators(project,config,state,data):
+def run_generators(project,config,state,data,index=None):
     generators = config['generate']
     # check generators for required fields, and
     # supply any needed default values.
     generators = check_generators(project,generators)
     # get any partially collected data from previous iteration.
-    partials = state.pop('partials',{})
+    # partials are decoded lazily, one generator at a time.
+    partials = pu.load_partials(state.pop('partials',None))
+    state.pop('partials-file',None) # marker used by earlier versions.
     # get a uid generator.
     mkuid = du.get_uid_generator()
+    # sort the inputs of all generators in a single pass over the data.
+    sorts = sort_generator_inputs(generators,data,index)
     # initialize collectors for partials & generated rows.
     newpartials,newrows = {},[]
-    for gen in generators: # iteratively run all generators.
+    for gen,sort in zip(generators,sorts): # iteratively run all generators.
         node,name,unit = gen['node'],gen['name'],gen['unit']
         # generate a type-checked row generator.
         mkrow = du.row_generator(node,name,unit)
         gid = mkuid(mkrow(0,0)) # get the uid of the generated rows.
         acount = len(gen['add']) # expected data-point count for `add`.
         scount = len(gen['sub']) # expected data-point count for `sub`.
-        sort = {} # { timestamp: {action: { uid: value } } }
-        for row in data: # iterate over data to find & sort matches.
-            uid = mkuid(row) # get the row uid.
-            if uid in gen['add']:
-                action = 'add'
-            elif uid in gen['sub']:
-                action = 'sub'
-            else: continue
-            tid = str(int(row.timestamp)) # generate time id.
-            if not tid in sort: # initialize new time point if needed.
-                sort[tid] = {'add': {}, 'sub': {}}
-            sort[tid][action][uid] = row.value
+        start = len(newrows) # position of this generator's first row.
+        # generators with a `tolerance` or `policy` align their inputs
+        # by nearest time rather than requiring identical timestamps.
+        if 'tolerance' in gen or 'policy' in gen:
+            # carry over all partials, not just those at current times.
+            for tid,point in (partials[gid]() if gid in partials else {}).items():
+                if not tid in sort: sort[tid] = {'add': {}, 'sub': {}}
+                sort[tid]['add'].update(point.get('add',{}))
+                sort[tid]['sub'].update(point.get('sub',{}))
+            points,pending = align_inputs(gen,sort)
+            for tid,val in points:
+                newrows.append(mkrow(tid,val))
+            if pending:
+                newpartials.setdefault(gid,{}).update(pending)
+            default = pu.EXPIRE if 'tolerance' in gen else None
+            expire_partials(newpartials.get(gid),sort,gen.get('expire',default))
+            if index: index_rows_at_end(index,gid,newrows[start:])
+            continue
         if gid in partials: # get any partials if they exist.
+            points = partials[gid]()
             for tid in sort:
-                if not tid in partials[gid]: continue
-                pa = partials[gid][tid].get('add',{})
-                ps = partials[gid][tid].get('sub',{})
+                if not tid in points: continue
+                pa = points[tid].get('add',{})
+                ps = points[tid].get('sub',{})
                 sort[tid]['add'].update(pa)
                 sort[tid]['sub'].update(ps)
         # iterate though the fully populated sorting,
@@ -182,15 +275,148 @@ def run_generators(project,config,state,data):
             val -= sum(sort[tid]['sub'].values())
             row = mkrow(tid,val) # pass time & value to generator.
             newrows.append(row)
-    # save partials to `sate` if appropriate.
-    if newpartials:
-        state['partials'] = newpartials
-        state['partials-file'] = 'partial-calcs'
+        # drop partials which are too old to ever be completed.
+        expire_partials(newpartials.get(gid),sort,gen.get('expire'))
+        # add this generator's rows to the index.
+        if index: index_rows_at_end(index,gid,newrows[start:])
+    # save partials to `state` (as a blob) if appropriate.
+    if any(newpartials.values()):
+        state['partials'] = pu.dump_partials(newpartials)
     data += newrows
     return state,data
 
 
 
+# align the inputs of a generator which has a time `tolerance`.  each
+# input is sorted into a series, and the points of the reference series
+# (the first `add` input) are matched against the other series in one
+# merged pass, using the `nearest` point within `tolerance` seconds, or
+# the `previous` point at most `tolerance` seconds earlier.  `sort` is
+# of the same form as produced by `sort_generator_inputs`.  returns the
+# generated `(tid,value)` pairs, and the points (in the same form as
+# `sort`) which may still be needed once more data arrives.
+def align_inputs(gen,sort):
+    mkerr = reshape_error('aligning inputs of generator: ' + gen['name'])
+    tolerance = gen.get('tolerance',0)
+    policy = gen.get('policy','nearest')
+    if not policy in ('nearest','previous'):
+        raise Exception(mkerr('unrecognized policy: ' + str(policy)))
+    uids = list(dict.fromkeys(gen['add'] + gen['sub']))
+    action = {uid: 'sub' for uid in gen['sub']}
+    action.update({uid: 'add' for uid in gen['add']})
+    # series of the form `{uid: [(time,tid,value),...]}`.
+    series = {uid: [] for uid in uids}
+    for tid,point in sort.items():
+        for act in ('add','sub'):
+            for uid,val in point[act].items():
+                if action.get(uid) == act: series[uid].append((int(tid),tid,val))
+    for points in series.values(): points.sort()
+    ref,others = uids[0],uids[1:]
+    sign = lambda uid: 1 if action[uid] == 'add' else -1
+    # reference points can only be resolved once all other series
+    # have data up to (or, for `nearest`, past) their time.
+    reach = tolerance if policy == 'nearest' else 0
+    ends = [series[u][-1][0] if series[u] else float('-inf') for u in others]
+    horizon = min(ends,default=float('inf'))
+    cursor = {u: 0 for u in others}
+    generated,done = [],None
+    for t,tid,val in series[ref]:
+        if t + reach > horizon: break
+        done = t
+        total = sign(ref) * val
+        for u in others:
+            points,i = series[u],cursor[u]
+            while i + 1 < len(points) and points[i+1][0] <= t: i += 1
+            cursor[u] = i
+            match = pick_point(points,i,t,tolerance,policy)
+            if match is None: break
+            total += sign(u) * match[2]
+        else: generated.append((tid,total))
+    # keep all points which a later reference point could still use.
+    cutoff = done - tolerance if done is not None else float('-inf')
+    pending = {}
+    for uid,points in series.items():
+        for t,tid,val in points:
+            if t < cutoff or (uid == ref and done is not None and t <= done):
+                continue
+            if not tid in pending: pending[tid] = {'add': {}, 'sub': {}}
+            pending[tid][action[uid]][uid] = val
+    return generated,pending
+
+
+# pick the point of a sorted series to align with time `t`, where
+# `i` is the position of the last point at or before `t` (if any).
+def pick_point(points,i,t,tolerance,policy):
+    candidates = []
+    before = bool(points) and points[i][0] <= t
+    if before: candidates.append(points[i])
+    if policy == 'nearest':
+        after = i + 1 if before else i
+        if after < len(points): candidates.append(points[after])
+    best = min(candidates,key=lambda p: abs(p[0] - t),default=None)
+    if best is None or abs(best[0] - t) > tolerance: return None
+    return best
+
+
+# drop partials which are more than `expire` seconds older than
+# the newest time seen by a generator (if `expire` is set).
+def expire_partials(partial,sort,expire):
+    if not partial or expire is None or not sort: return
+    oldest = max(map(int,sort)) - expire
+    for tid in [tid for tid in partial if int(tid) < oldest]:
+        del partial[tid]
+
+
+# sort the input rows of each generator by time & action.  returns
+# one dict of the form `{ timestamp: {action: { uid: value } } }` per
+# generator.  rows are matched against a lookup of the form
+# `{ uid: [(generator-index,action),...] }`, so the data is only
+# scanned once no matter how many generators are configured.  if a
+# shared uid index is supplied, only the groups of matching uids
+# are visited (see `iter_uid_rows`).
+def sort_generator_inputs(generators,data,index=None):
+    inputs = {}
+    for i,gen in enumerate(generators):
+        for action in ('add','sub'):
+            for uid in gen[action]:
+                targets = inputs.setdefault(uid,[])
+                # a uid in both `add` & `sub` only counts as `add`.
+                if not any(t[0] == i for t in targets):
+                    targets.append((i,action))
+    sorts = [{} for gen in generators]
+    for uid,row in iter_uid_rows(data,index,inputs):
+        if not uid in inputs: continue
+        tid = str(int(row.timestamp)) # generate time id.
+        for i,action in inputs[uid]:
+            sort = sorts[i]
+            if not tid in sort: # initialize new time point if needed.
+                sort[tid] = {'add': {}, 'sub': {}}
+            sort[tid][action][uid] = row.value
+    return sorts
+
+
+# iterate over `(uid,row)` pairs in the order of `data`.  if `index`
+# is ordered (i.e.; `data` is exactly the concatenation of its groups),
+# only the groups whose uids are in `uids` are visited.
+def iter_uid_rows(data,index=None,uids=None):
+    if index and index['ordered'] and uids is not None:
+        for uid,rows in index['groups'].items():
+            if not uid in uids: continue
+            for row in rows: yield uid,row
+    else: yield from zip(du.get_uids(data),data)
+
+
+# add rows with uid `uid` which are being appended to the end of
+# the data to `index`.  the index stays ordered as long as the rows
+# start a new group, or extend the last one.
+def index_rows_at_end(index,uid,rows):
+    if not rows: return
+    groups = index['groups']
+    if uid in groups and uid != next(reversed(groups)):
+        index['ordered'] = False
+    groups.setdefault(uid,[]).extend(rows)
+
+
 def check_generators(project,generators):
     default = lambda: {'node':project,'unit':'undefined','sub':[]}
     required = ['name','add']
@@ -206,14 +432,18 @@ def check_generators(project,generators):
 
 # run identity-level replacements (e.g.; name="foo" to
 # name="bar").
-def run_replacements(project,config,state,data):
+def run_replacements(project,config,state,data,index=None):
     if not data: return state,data # handle no-rows case.
     # generate a basic error message template for this section.
     mkerr = reshape_error("running value-based replacement operations")
     # generate the dict of replacements from the `replace` spec.
     replacements = {du.fmt_string(k): v for k,v in config['replace'].items()}
     settings = config.get('settings',{}) # get handle to `settings`.
-    uidsort = sort_by_uid(settings,data) # sort rows by their uids.
+    # sort rows by their uids.
+    uidsort = index['groups'] if index else sort_by_uid(settings,data)
+    # index of the remapped rows, which replaces `index` once done.
+    reindex = {'groups': {}, 'ordered': True}
+    mkuid = du.get_uid_generator()
     target = settings.get('to-replace',[]) # get target spec if it exists.
     # if only one target is declared, ensure it is still in list form.
     target = target if isinstance(target,list) else [target]
@@ -235,32 +465,26 @@ def run_replacements(project,config,state,data):
             umap = {f:v for f,v in zip(target,umap)}
         # get all rows that match `uid`.
         rows = uidsort.pop(uid,[])
-        # generate a handy-dandy row converter.
-        remap = lambda row: du.update_row(umap,row)
         # remap rows to their new form.
-        newrows = list(map(remap,rows))
+        newrows = du.update_rows(umap,rows)
         # add remapped rows to the collector.
         remapped += newrows
+        # a remapped group still shares a single uid.
+        if newrows: index_rows_at_end(reindex,mkuid(newrows[0]),newrows)
     # if any rows remain in uidsort, pass off to handler.
     if uidsort:
         unmapped = []
         for rows in uidsort.values():
             unmapped += rows
         handle_removals(project,config,'replace',unmapped)
+    if index: index.update(reindex)
     return state,remapped
 
 
 
 def sort_by_uid(settings,rows):
     key = settings.get('uid-key',None)
-    mkuid = du.get_uid_generator(key)
-    uidsort = {}
-    for row in rows:
-        uid = mkuid(row)
-        if not uid in uidsort:
-            uidsort[uid] = []
-        uidsort[uid].append(row)
-    return uidsort
+    return du.index_rows(rows,key)['groups']
 
 
 def sort_by_timestamp(rows):
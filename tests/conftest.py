@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+import os.path as path
+import sys
+
+# tests import modules as `src.*`, relative to the repository root.
+sys.path.insert(0,path.dirname(path.dirname(path.abspath(__file__))))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+from src.core.data_utils import Row
+import src.reshape.downsample as downsample
+import src.core.file_utils as fu
+from unittest import mock
+
+# downsampling must not depend on how the rows are split up; the
+# latest bucket of each uid is held open until a row for a later
+# bucket arrives, whether between chunks or between runs.
+
+# 120 rows at 10 second spacing, from 2001.
+START = 999999900.0
+rows = [Row('node','sensor','kw',START + 10 * i,1.0) for i in range(120)]
+config = {'settings': {'width': 900, 'method': 'count'}}
+
+
+def summarize(out):
+    return [(r.timestamp,r.value) for r in out]
+
+def run(state,data,now=None):
+    if now is None: return downsample.reshape('test',config,state,data)
+    with mock.patch('time.time',return_value=now):
+        return downsample.reshape('test',config,state,data)
+
+
+def test_whole():
+    state,out = run({},rows)
+    assert summarize(out) == [(START,90.0)]
+    assert state['open']['node-sensor-kw']['time'] == START + 900
+
+
+def test_mid_bucket_split():
+    state,head = run({},rows[:50])
+    state,tail = run(state,rows[50:])
+    assert head == []
+    assert summarize(tail) == [(START,90.0)]
+    assert state == run({},rows)[0]
+
+
+def test_run_boundary(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state,head = run({},rows[:45])
+    fu.save_state('test',{'downsample': state})
+    state = fu.get_state('test')['downsample']
+    state,tail = run(state,rows[45:])
+    assert summarize(head + tail) == [(START,90.0)]
+
+
+def test_quiet_flush():
+    state,out = run({},rows)
+    # a later run with no rows for the uid flushes its open bucket.
+    state,out = run(state,[Row('node','other','kw',START,1.0)])
+    assert summarize(r for r in out if r.name == 'sensor') == [(START + 900,30.0)]
+    # rows for a flushed bucket are late, & are dropped.
+    state,out = run(state,rows[-5:])
+    assert not any(r.name == 'sensor' for r in out)
+    assert not 'node-sensor-kw' in state.get('open',{})
+
+
+def test_live_data_kept_open():
+    now = START + 1200
+    state,out = run({},rows,now=now)
+    state,out = run(state,[Row('node','other','kw',START,1.0)],now=now)
+    assert not any(r.name == 'sensor' for r in out)
+    assert 'node-sensor-kw' in state['open']
+
+
+def test_stream_matches_reshape():
+    data = rows + [Row('node','other','kw',START + 5 * i,float(i)) for i in range(300)]
+    data.sort(key=lambda r: r.timestamp)
+    whole_state,whole = downsample.reshape('test',config,{},list(data))
+    assert downsample.streamable(config)
+    for size in (1,7,50,len(data)):
+        chunks = (data[i:i + size] for i in range(0,len(data),size))
+        gen = downsample.stream('test',config,{},chunks)
+        out = []
+        try:
+            while True: out += next(gen)
+        except StopIteration as stop:
+            state = stop.value
+        key = lambda r: (r.name,r.timestamp)
+        assert sorted(out,key=key) == sorted(whole,key=key)
+        assert state == whole_state
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+from src.core.data_utils import Row
+import src.reshape.field as field
+from collections import namedtuple
+from unittest import mock
+import pytest
+
+# conformance tests for the compiled `field` transformer.  each
+# config is run through `field.reshape` and through `reference`,
+# which applies the declared sub-steps one at a time & row by row.
+
+NOW = 1234567.891234
+
+rows = [Row('n{}'.format(i % 3),'s{}'.format(i % 5),'kw',float(1000 + i),i / 3)
+    for i in range(100)]
+
+modify = {
+    'node': {'title': 'Node', 'index': 2},
+    'timestamp': {'title': 'Time', 'index': 0, 'type': 'int'},
+    'value': {'title': 'Val', 'index': 1, 'type': 'str'}
+    }
+
+cases = {
+    'modify': {'modify': modify},
+    'modify-one': {'modify': {'unit': {'title': 'u', 'index': 0}}},
+    'reorder': {'modify': {
+        'value': {'title': 'v', 'index': 0},
+        'unit': {'title': 'u', 'index': 1},
+        'name': {'title': 'n', 'index': 2},
+        'node': {'title': 'd', 'index': 3},
+        'timestamp': {'title': 't', 'index': 4}
+        }},
+    'literal': {'generate': [{'value': 'literal', 'title': 'src', 'ident': 'x'}]},
+    'current-time': {'generate': [
+        {'value': 'current-time', 'title': 'now'},
+        {'value': 'current-time', 'title': 'then', 'round': 0, 'index': 0}
+        ]},
+    'const-insert': {'generate': [
+        {'value': 'literal', 'title': 'a', 'ident': 7, 'index': 1},
+        {'value': 'literal', 'title': 'b', 'ident': 'z', 'index': -2},
+        {'value': 'literal', 'title': 'c', 'ident': 1.5, 'index': 0}
+        ]},
+    'modify-generate': {
+        'modify': modify,
+        'generate': [
+            {'value': 'literal', 'title': 'a', 'ident': 1.5, 'index': 0},
+            {'value': 'current-time', 'title': 'b'}
+            ]
+        },
+    'generate-modify': {
+        'modify': {
+            'timestamp': {'title': 't', 'index': 0, 'type': 'float'},
+            'value': {'title': 'v', 'index': 1, 'type': 'bool'},
+            'k': {'title': 'k', 'index': 2, 'type': 'int'}
+            },
+        'generate': [{'value': 'literal', 'title': 'k', 'ident': '3', 'index': 5}],
+        'settings': {'in-order': ['generate','modify']}
+        },
+    'repeated-steps': {
+        'modify': {
+            'timestamp': {'title': 'timestamp', 'index': 0, 'type': 'int'},
+            'value': {'title': 'value', 'index': 1, 'type': 'str'},
+            'k': {'title': 'k', 'index': 2, 'type': 'float'}
+            },
+        'generate': [{'value': 'literal', 'title': 'k', 'ident': '3'}],
+        'settings': {'in-order': ['generate','modify','modify']}
+        }
+    }
+
+
+# apply the sub-steps of `config` to `rows` one at a time.
+def reference(config,rows):
+    order = config.get('settings',{}).get('in-order',['modify','generate'])
+    for step in order:
+        if not step in config: continue
+        if step == 'modify': rows = reference_modify(config['modify'],rows)
+        else: rows = reference_generate(config['generate'],rows)
+    return rows
+
+def reference_modify(fieldmap,rows):
+    types = {'int': int, 'float': float, 'str': str, 'bool': bool, 'none': lambda v: v}
+    fields = rows[0]._fields
+    specs = sorted((fieldmap[f]['index'],i,fieldmap[f]) for i,f in enumerate(fields)
+        if f in fieldmap)
+    fmtrow = namedtuple('fmtrow',[s['title'] for _,_,s in specs])
+    cast = lambda r,i,s: types[s.get('type','none')](r[i])
+    return [fmtrow(*(cast(r,i,s) for _,i,s in specs)) for r in rows]
+
+def reference_generate(generators,rows):
+    for gen in generators:
+        if gen['value'] == 'literal': value = gen['ident']
+        else:
+            dec = gen.get('round',6)
+            value = round(NOW,dec) if dec > 0 else int(NOW)
+        index = gen.get('index','append')
+        if index == 'append': insert = lambda v,r: [*r,v]
+        else: insert = lambda v,r: [*r[:index],v,*r[index:]]
+        mkrow = namedtuple('row',insert(gen['title'],rows[0]._fields))
+        rows = [mkrow(*insert(value,r)) for r in rows]
+    return rows
+
+
+def run(config,data):
+    with mock.patch('time.time',return_value=NOW):
+        return field.reshape('test',config,{},data)[1]
+
+
+@pytest.mark.parametrize('name',cases)
+def test_conformance(name):
+    expect = reference(cases[name],rows)
+    result = run(cases[name],rows)
+    assert [r._fields for r in result] == [r._fields for r in expect]
+    assert [tuple(r) for r in result] == [tuple(r) for r in expect]
+    assert [list(map(type,r)) for r in result] == [list(map(type,r)) for r in expect]
+
+
+@pytest.mark.parametrize('name',cases)
+def test_stream(name):
+    chunks = [rows[:30],[],rows[30:]]
+    with mock.patch('time.time',return_value=NOW):
+        stream = field.stream('test',cases[name],{},iter(chunks))
+        result = [r for chunk in stream for r in chunk]
+    assert result == run(cases[name],rows)
+
+
+def test_empty():
+    assert run(cases['modify-generate'],[]) == []
+
+
+@pytest.mark.parametrize('config',[
+    {'modify': {'bogus': {'title': 't', 'index': 0}}},
+    {'modify': {'value': {'title': 't', 'index': 0, 'type': 'complex'}}},
+    {'generate': [{'value': 'literal', 'title': 'k', 'ident': 1, 'index': 'front'}]},
+    {'generate': [{'value': 'bogus', 'title': 'k'}]},
+    {'other': {}}
+    ])
+def test_errors(config):
+    with pytest.raises(Exception):
+        run(config,rows)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import src.core.file_utils as fu
+import os
+
+# state is saved as one `.toml` file per top-level key, with any
+# `bytes` values split out into `.bin` files.  files for keys which
+# are no longer part of state are removed, so that they are not
+# loaded again on the next run.
+
+STATE_DIR = 'tmp/projects/test/state-files/'
+
+
+def test_round_trip(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = {'static': {'ledger': b'\x00\x01'}, 'value': {'nonce': {'a': 1}}}
+    fu.save_state('test',state)
+    assert sorted(os.listdir(STATE_DIR)) == ['static.ledger.bin','value.toml']
+    assert fu.get_state('test') == state
+
+
+def test_stale_files_removed(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = {
+        'value': {'nonce': {'a': 1}, 'partials': b'\x02'},
+        'webctrl': {'nonce': {'b': 2}}
+        }
+    fu.save_state('test',state)
+    # emptied & removed keys must not come back on the next load.
+    fu.save_state('test',{'value': {'nonce': {'a': 2}}, 'webctrl': {}})
+    assert sorted(os.listdir(STATE_DIR)) == ['value.toml']
+    assert fu.get_state('test') == {'value': {'nonce': {'a': 2}}}
+
+
+def test_other_files_kept(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fu.save_state('test',{'value': {'nonce': {'a': 1}}})
+    with open(STATE_DIR + 'notes.txt','w') as fp: fp.write('keep me')
+    fu.save_state('test',{})
+    assert os.listdir(STATE_DIR) == ['notes.txt']
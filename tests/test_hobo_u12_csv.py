@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import src.acquire.parsers.hobo_u12_csv as hobo
+import calendar
+import time
+import os
+import pytest
+
+# the hobo-u12 time parser must match the original conversion (one
+# `strptime` & `mktime` per string, in the host's zone) exactly, &
+# only apply the logger's offset when `honor-offset` is set.
+
+FMT = '%m/%d/%y %I:%M:%S %p'
+
+# times around the us dst changes of 2017, in order, every 7 minutes.
+def sample_times():
+    times = []
+    for start in (1489294800,1509854400,1483264800):
+        for i in range(0,172800,427):
+            times.append(time.strftime(FMT,time.gmtime(start + i)))
+    return times + ['1/2/17 3:04:05 pm','01/02/17 12:00:00 AM','01/02/17 12:00:00 PM']
+
+def original(t,offset):
+    if not offset: return time.mktime(time.strptime(t,FMT))
+    return time.mktime(time.strptime(t + ' ' + offset,FMT + ' %z'))
+
+@pytest.fixture(params=['UTC','America/New_York','Pacific/Honolulu','Australia/Lord_Howe'])
+def zone(request):
+    prev = os.environ.get('TZ')
+    os.environ['TZ'] = request.param
+    time.tzset()
+    yield request.param
+    if prev is None: os.environ.pop('TZ')
+    else: os.environ['TZ'] = prev
+    time.tzset()
+
+
+@pytest.mark.parametrize('offset',[None,'-1000','+0530'])
+def test_host_zone(zone,offset):
+    times = sample_times()
+    assert hobo.parse_times(times,offset) == [original(t,offset) for t in times]
+
+
+@pytest.mark.parametrize('offset',['-1000','+0530'])
+def test_honor_offset(zone,offset):
+    times = sample_times()
+    gmtoff = time.strptime(offset,'%z').tm_gmtoff
+    expect = [float(calendar.timegm(time.strptime(t,FMT)) - gmtoff) for t in times]
+    assert hobo.parse_times(times,offset,honor=True) == expect
+
+
+@pytest.mark.parametrize('value',['13/01/17 01:00:00 AM','01/01/17 01:00:00 XM','x'])
+def test_malformed(value):
+    with pytest.raises(ValueError):
+        hobo.parse_times([value],'-1000')